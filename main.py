@@ -1,12 +1,35 @@
-import cv2
-import numpy as np
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk, ImageEnhance
+from PIL import Image, ImageTk
 import os
 from datetime import datetime
 import threading
-import json
+
+from outpaint import engine
+from outpaint.backends import backend_names, get_backend
+from outpaint.batch import BatchRunner, list_images
+from outpaint.blend import BLEND_MODES
+from outpaint.cache import ResultCache
+from outpaint.display import FALLBACK_SIZE, FrameCache
+from outpaint.jobs import CANCELLED, DONE, JobQueue
+from outpaint.loader import LazyImage
+from outpaint.metrics import Metrics
+from outpaint.output import OUTPUT_FORMATS, ImageWriter, encode_params, output_extension, write_atomic
+from outpaint.preview import PreviewWorker, build_preview_pyramid, preview_level, preview_params
+from outpaint.settings import PROJECT_PATH, load_settings, save_settings, settings_path
+from outpaint.tuning import ThreadPolicy
+
+# Delay between the last slider tick and the live preview request
+PREVIEW_DEBOUNCE_MS = 40
+
+# Canvases redraw at most this often while the window is being resized
+RESIZE_THROTTLE_MS = 50
+
+# Suggestions for the fit field; an empty field uses the expansion size
+FIT_PRESETS = ("", "1:1", "4:3", "3:2", "16:9", "9:16", "21:9", "1920x1080", "3840x2160")
+
+# Failed images listed in the batch summary
+MAX_SHOWN_ERRORS = 10
 
 class ImageOutpaintingApp:
     def __init__(self, root):
@@ -16,11 +39,23 @@ class ImageOutpaintingApp:
         self.root.configure(bg='#f0f0f0')
         
         # Variables
+        self.source = None
         self.original_image = None
         self.processed_image = None
         self.canvas_width = 600
         self.canvas_height = 400
         self.processing = False
+        self.batch_runner = None
+        self.preview_levels = None
+        self.preview_after_id = None
+        self.process_pending = False
+        self.redraw_after_ids = {}
+        
+        # Scaled PhotoImages per (image, canvas size)
+        self.frames = FrameCache(lambda rgb: ImageTk.PhotoImage(Image.fromarray(rgb)))
+        
+        # Stage times and counters of this session
+        self.metrics = Metrics()
         
         # Setup project folders
         self.setup_project_folders()
@@ -28,12 +63,27 @@ class ImageOutpaintingApp:
         # Load settings
         self.load_settings()
         
+        # Result cache in the project temp folder
+        self.result_cache = ResultCache(os.path.join(self.folders['temp'], 'cache'),
+                                        self.settings['cache_size_mb'] * 1024 * 1024)
+        
+        # Results are encoded and written off the Tk thread
+        self.writer = ImageWriter()
+        
         self.setup_ui()
         self.setup_shortcuts()
+        
+        # Cancellable job queue for full-resolution processing
+        self.job_queue = JobQueue(lambda job: self.root.after(0, self.job_finished, job),
+                                  cache=self.result_cache)
+        
+        # Preview renderer; results are handed back to the Tk thread
+        self.preview_worker = PreviewWorker(
+            lambda request_id, result, error: self.root.after(0, self.show_preview, result, error))
     
     def setup_project_folders(self):
         """Create project folder structure"""
-        self.project_path = "Project_image_outpainting_app"
+        self.project_path = PROJECT_PATH
         self.folders = {
             'input': os.path.join(self.project_path, 'input'),
             'output': os.path.join(self.project_path, 'output'),
@@ -49,32 +99,11 @@ class ImageOutpaintingApp:
     
     def load_settings(self):
         """Load application settings"""
-        settings_file = os.path.join(self.folders['settings'], 'config.json')
-        self.settings = {
-            'last_expansion_size': 50,
-            'last_direction': 'all',
-            'last_method': 'telea',
-            'auto_save': True,
-            'quality': 95,
-            'preview_size': 300
-        }
-        
-        if os.path.exists(settings_file):
-            try:
-                with open(settings_file, 'r') as f:
-                    loaded_settings = json.load(f)
-                    self.settings.update(loaded_settings)
-            except:
-                pass
+        self.settings = load_settings(settings_path(self.project_path))
     
     def save_settings(self):
         """Save current settings"""
-        settings_file = os.path.join(self.folders['settings'], 'config.json')
-        try:
-            with open(settings_file, 'w') as f:
-                json.dump(self.settings, f, indent=2)
-        except:
-            pass
+        save_settings(self.settings, settings_path(self.project_path))
     
     def setup_ui(self):
         # Style configuration
@@ -137,6 +166,8 @@ class ImageOutpaintingApp:
         
         ttk.Button(quick_frame, text="🔄 Process", 
                   command=self.process_outpainting_threaded, width=20).pack(pady=2)
+        ttk.Button(quick_frame, text="⏹ Cancel", 
+                  command=self.cancel_processing, width=20).pack(pady=2)
         ttk.Button(quick_frame, text="🔍 Preview", 
                   command=self.quick_preview, width=20).pack(pady=2)
         ttk.Button(quick_frame, text="↩️ Reset", 
@@ -164,16 +195,46 @@ class ImageOutpaintingApp:
         ttk.Label(param_frame, text="Direction:").pack(anchor=tk.W, pady=(10, 0))
         self.direction_var = tk.StringVar(value=self.settings['last_direction'])
         direction_combo = ttk.Combobox(param_frame, textvariable=self.direction_var,
-                                     values=["all", "left", "right", "top", "bottom", "horizontal", "vertical"],
+                                     values=list(engine.DIRECTIONS),
                                      state="readonly")
         direction_combo.pack(fill=tk.X, pady=2)
+        direction_combo.bind('<<ComboboxSelected>>', lambda e: self.schedule_preview())
+        
+        # Fit to an aspect ratio, resolution or per-side margins instead of the expansion size
+        ttk.Label(param_frame, text="Fit To (W:H, WxH or T,B,L,R):").pack(anchor=tk.W, pady=(10, 0))
+        self.fit_var = tk.StringVar(value=self.settings['last_fit'])
+        fit_combo = ttk.Combobox(param_frame, textvariable=self.fit_var, values=FIT_PRESETS)
+        fit_combo.pack(fill=tk.X, pady=2)
+        fit_combo.bind('<<ComboboxSelected>>', lambda e: self.schedule_preview())
+        fit_combo.bind('<Return>', lambda e: self.schedule_preview())
         
         # Method
         ttk.Label(param_frame, text="Inpainting Method:").pack(anchor=tk.W, pady=(10, 0))
         self.method_var = tk.StringVar(value=self.settings['last_method'])
         method_combo = ttk.Combobox(param_frame, textvariable=self.method_var,
-                                  values=["telea", "ns"], state="readonly")
+                                  values=list(backend_names()), state="readonly")
         method_combo.pack(fill=tk.X, pady=2)
+        method_combo.bind('<<ComboboxSelected>>', lambda e: self.method_selected())
+        
+        # Speed/quality profile of the selected backend
+        self.method_profile_label = ttk.Label(param_frame, text="", font=("Arial", 8))
+        self.method_profile_label.pack(anchor=tk.W)
+        self.update_method_profile()
+        
+        # Live preview while adjusting parameters
+        self.live_preview_var = tk.BooleanVar(value=self.settings['live_preview'])
+        ttk.Checkbutton(param_frame, text="Live preview", 
+                       variable=self.live_preview_var).pack(anchor=tk.W, pady=(10, 0))
+        
+        # Band-limited inpainting
+        self.band_mode_var = tk.BooleanVar(value=self.settings['band_mode'])
+        ttk.Checkbutton(param_frame, text="Fast seam band only", 
+                       variable=self.band_mode_var).pack(anchor=tk.W, pady=(10, 0))
+        
+        # Tiled parallel inpainting
+        self.tiled_var = tk.BooleanVar(value=self.settings['tiled'])
+        ttk.Checkbutton(param_frame, text="Parallel tiles", 
+                       variable=self.tiled_var).pack(anchor=tk.W)
         
         # Auto-save checkbox
         self.auto_save_var = tk.BooleanVar(value=self.settings['auto_save'])
@@ -203,6 +264,11 @@ class ImageOutpaintingApp:
         self.processed_canvas = tk.Canvas(result_frame, bg="white", relief=tk.SUNKEN, bd=2)
         self.processed_canvas.pack(fill=tk.BOTH, expand=True)
         
+        # Redraw the shown images at the new size after a resize
+        for canvas in (self.original_canvas, self.processed_canvas):
+            canvas.source = None
+            canvas.bind('<Configure>', lambda e, canvas=canvas: self.schedule_redraw(canvas))
+        
         # Image info
         self.info_label = ttk.Label(image_frame, text="No image loaded", font=("Arial", 10))
         self.info_label.pack(pady=(10, 0))
@@ -222,6 +288,16 @@ class ImageOutpaintingApp:
                                 variable=self.quality_var, orient=tk.HORIZONTAL)
         quality_scale.pack(fill=tk.X, pady=2)
         
+        ttk.Label(quality_frame, text="Output Format:").pack(anchor=tk.W, pady=(5, 0))
+        self.output_format_var = tk.StringVar(value=self.settings['output_format'])
+        ttk.Combobox(quality_frame, textvariable=self.output_format_var,
+                     values=list(OUTPUT_FORMATS), state="readonly").pack(fill=tk.X, pady=2)
+        
+        ttk.Label(quality_frame, text="PNG Compression (-1 = fast default):").pack(anchor=tk.W, pady=(5, 0))
+        self.png_compression_var = tk.IntVar(value=self.settings['png_compression'])
+        ttk.Spinbox(quality_frame, from_=-1, to=9, textvariable=self.png_compression_var,
+                    width=5).pack(anchor=tk.W, pady=2)
+        
         # Batch Processing
         batch_frame = ttk.LabelFrame(advanced_frame, text="Batch Processing", padding="10")
         batch_frame.pack(fill=tk.X, pady=(0, 10))
@@ -243,6 +319,17 @@ class ImageOutpaintingApp:
         ttk.Checkbutton(enhance_frame, text="Enhance Sharpness", 
                        variable=self.enhance_sharpness).pack(anchor=tk.W)
         
+        self.enhance_margins_only = tk.BooleanVar(value=self.settings['enhance_margins_only'])
+        ttk.Checkbutton(enhance_frame, text="Outpainted area only", 
+                       variable=self.enhance_margins_only).pack(anchor=tk.W)
+        
+        ttk.Label(enhance_frame, text="Seam Blending:").pack(anchor=tk.W, pady=(5, 0))
+        self.blend_var = tk.StringVar(value=self.settings['blend'])
+        blend_combo = ttk.Combobox(enhance_frame, textvariable=self.blend_var,
+                                   values=list(BLEND_MODES), state="readonly")
+        blend_combo.pack(fill=tk.X, pady=2)
+        blend_combo.bind('<<ComboboxSelected>>', lambda e: self.schedule_preview())
+        
         # History
         history_frame = ttk.LabelFrame(advanced_frame, text="Recent Files", padding="10")
         history_frame.pack(fill=tk.X, pady=(0, 10))
@@ -280,6 +367,21 @@ class ImageOutpaintingApp:
     def update_expansion_label(self, value):
         """Update expansion size label"""
         self.expansion_label.config(text=str(int(float(value))))
+        self.schedule_preview()
+    
+    def method_selected(self):
+        """React to a new inpainting method"""
+        self.update_method_profile()
+        self.schedule_preview()
+    
+    def update_method_profile(self):
+        """Show the speed/quality profile of the selected method"""
+        try:
+            backend = get_backend(self.method_var.get())
+        except ValueError:
+            self.method_profile_label.config(text="")
+            return
+        self.method_profile_label.config(text=f"{backend.description} ({backend.profile})")
     
     def update_status(self, message):
         """Update status bar"""
@@ -303,28 +405,13 @@ class ImageOutpaintingApp:
             try:
                 self.update_status("Loading image...")
                 
-                # Load image using OpenCV
-                self.original_image = cv2.imread(file_path)
-                if self.original_image is None:
+                # Reduced decode for display; full resolution when processing needs it
+                if not self.open_image(file_path):
                     messagebox.showerror("Error", "Could not load image")
                     return
                 
-                # Store original path
-                self.original_path = file_path
-                
-                # Convert BGR to RGB for display
-                rgb_image = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
-                
-                # Display original image
-                self.display_image(rgb_image, self.original_canvas)
-                
-                # Update image info
-                h, w, c = self.original_image.shape
-                file_size = os.path.getsize(file_path) / 1024  # KB
-                self.info_label.config(text=f"Size: {w}x{h} | Channels: {c} | File: {file_size:.1f} KB")
-                
                 # Clear processed canvas
-                self.processed_canvas.delete("all")
+                self.clear_canvas(self.processed_canvas)
                 self.processed_image = None
                 
                 # Add to history
@@ -337,213 +424,280 @@ class ImageOutpaintingApp:
                 self.update_status("Error loading image")
                 messagebox.showerror("Error", f"Error loading image: {str(e)}")
     
+    def open_image(self, file_path):
+        """Decode a reduced copy of an image and show it; False if unreadable"""
+        source = LazyImage(file_path)
+        if source.error is not None:
+            return False
+        
+        self.source = source
+        self.original_path = file_path
+        self.original_image = source.full
+        self.process_pending = False
+        self.preview_levels = build_preview_pyramid(source.preview)
+        
+        self.display_image(source.preview, self.original_canvas)
+        
+        # Update image info from the header size
+        w, h = source.size
+        file_size = source.nbytes / 1024  # KB
+        self.info_label.config(text=f"Size: {w}x{h} | Channels: 3 | File: {file_size:.1f} KB")
+        return True
+    
+    def full_image_loaded(self, source, image):
+        """Full-resolution decode finished; run the processing that waited for it"""
+        if source is not self.source:
+            return
+        if image is None:
+            self.process_pending = False
+            self.update_status("Error loading image")
+            messagebox.showerror("Error", source.error or "Could not load image")
+            return
+        self.original_image = image
+        if self.process_pending:
+            self.process_pending = False
+            self.process_outpainting_threaded()
+    
     def display_image(self, image, canvas):
-        """Enhanced image display with better scaling"""
+        """Show a BGR image scaled to fit a canvas
+        
+        Scaling happens before the colour conversion and the PhotoImage of
+        each (image, canvas size) is cached, so redraws are nearly free.
+        """
         if image is None:
             return
         
         # Get canvas dimensions
-        canvas.update_idletasks()
-        canvas_width = canvas.winfo_width() if canvas.winfo_width() > 1 else 300
-        canvas_height = canvas.winfo_height() if canvas.winfo_height() > 1 else 200
+        canvas_width = canvas.winfo_width() if canvas.winfo_width() > 1 else FALLBACK_SIZE[0]
+        canvas_height = canvas.winfo_height() if canvas.winfo_height() > 1 else FALLBACK_SIZE[1]
         
-        # Calculate scaling to fit canvas with margin
-        h, w = image.shape[:2]
-        margin = 20
-        scale = min((canvas_width - margin)/w, (canvas_height - margin)/h)
-        
-        new_width = int(w * scale)
-        new_height = int(h * scale)
-        
-        # Resize image
-        resized_image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        
-        # Convert to PIL Image and then to PhotoImage
-        pil_image = Image.fromarray(resized_image)
-        photo = ImageTk.PhotoImage(pil_image)
+        if canvas.source is not None and canvas.source is not image:
+            self.frames.discard(canvas.source)
+        photo = self.frames.get(image, (canvas_width, canvas_height))
         
         # Clear canvas and display image
         canvas.delete("all")
         canvas.create_image(canvas_width//2, canvas_height//2, image=photo)
         
-        # Keep a reference to prevent garbage collection
+        # Keep references for redraws and to prevent garbage collection
+        canvas.source = image
         canvas.image = photo
     
+    def clear_canvas(self, canvas):
+        """Remove the image shown on a canvas"""
+        if canvas.source is not None:
+            self.frames.discard(canvas.source)
+        canvas.delete("all")
+        canvas.source = None
+        canvas.image = None
+    
+    def schedule_redraw(self, canvas):
+        """Throttle redraws while a canvas is being resized"""
+        if canvas.source is None or canvas in self.redraw_after_ids:
+            return
+        self.redraw_after_ids[canvas] = self.root.after(RESIZE_THROTTLE_MS, self.redraw_canvas, canvas)
+    
+    def redraw_canvas(self, canvas):
+        """Show a canvas's image again at its current size"""
+        self.redraw_after_ids.pop(canvas, None)
+        self.display_image(canvas.source, canvas)
+    
     def create_outpainting_mask(self, image, expansion_size, direction):
         """Enhanced mask creation with new direction options"""
-        h, w = image.shape[:2]
-        
-        # Calculate new dimensions based on direction
-        if direction == "all":
-            new_h = h + 2 * expansion_size
-            new_w = w + 2 * expansion_size
-            offset_x, offset_y = expansion_size, expansion_size
-        elif direction == "horizontal":
-            new_h = h
-            new_w = w + 2 * expansion_size
-            offset_x, offset_y = expansion_size, 0
-        elif direction == "vertical":
-            new_h = h + 2 * expansion_size
-            new_w = w
-            offset_x, offset_y = 0, expansion_size
-        elif direction == "left":
-            new_h = h
-            new_w = w + expansion_size
-            offset_x, offset_y = expansion_size, 0
-        elif direction == "right":
-            new_h = h
-            new_w = w + expansion_size
-            offset_x, offset_y = 0, 0
-        elif direction == "top":
-            new_h = h + expansion_size
-            new_w = w
-            offset_x, offset_y = 0, expansion_size
-        elif direction == "bottom":
-            new_h = h + expansion_size
-            new_w = w
-            offset_x, offset_y = 0, 0
-        
-        # Create expanded canvas
-        expanded_image = np.zeros((new_h, new_w, 3), dtype=np.uint8)
-        
-        # Place original image in the expanded canvas
-        expanded_image[offset_y:offset_y+h, offset_x:offset_x+w] = image
-        
-        # Create mask (white = area to inpaint, black = known area)
-        mask = np.ones((new_h, new_w), dtype=np.uint8) * 255
-        mask[offset_y:offset_y+h, offset_x:offset_x+w] = 0
-        
-        return expanded_image, mask
+        return engine.create_outpainting_mask(image, expansion_size, direction)
     
     def enhance_image(self, image):
         """Apply image enhancements"""
-        if not self.enhance_contrast.get() and not self.enhance_sharpness.get():
-            return image
-        
-        # Convert to PIL for enhancement
-        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        
-        if self.enhance_contrast.get():
-            enhancer = ImageEnhance.Contrast(pil_image)
-            pil_image = enhancer.enhance(1.2)
-        
-        if self.enhance_sharpness.get():
-            enhancer = ImageEnhance.Sharpness(pil_image)
-            pil_image = enhancer.enhance(1.1)
-        
-        # Convert back to OpenCV format
-        return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        return engine.enhance_image(image, self.enhance_contrast.get(), self.enhance_sharpness.get())
+    
+    def outpaint_params(self):
+        """Collect current engine parameters from the UI
+        
+        Raises ValueError when the fit field cannot be read.
+        """
+        fit = engine.parse_fit(self.fit_var.get())
+        return {
+            **fit,
+            'expansion': self.expansion_var.get(),
+            'direction': self.direction_var.get(),
+            'method': self.method_var.get(),
+            'contrast': self.enhance_contrast.get(),
+            'sharpness': self.enhance_sharpness.get(),
+            'enhance_margins_only': self.enhance_margins_only.get(),
+            'blend': self.blend_var.get(),
+            'blend_width': self.settings['blend_width'] or None,
+            'mode': 'band' if self.band_mode_var.get() else 'full',
+            'tile_size': engine.DEFAULT_TILE_SIZE if self.tiled_var.get() else None,
+            'memory_budget': self.settings['memory_budget_mb'] * 1024 * 1024 or None,
+            'temp_dir': self.folders['temp'],
+            'backend_options': {'time_budget': self.settings['time_budget'] or None}
+        }
     
     def process_outpainting_threaded(self):
-        """Process outpainting in a separate thread"""
-        if self.processing:
-            messagebox.showwarning("Warning", "Processing already in progress")
+        """Queue outpainting of the current image as a cancellable job"""
+        if self.batch_runner is not None:
+            messagebox.showwarning("Warning", "Batch processing already in progress")
             return
         
-        if self.original_image is None:
+        if self.source is None:
             messagebox.showwarning("Warning", "Please load an image first")
             return
         
-        # Start processing in thread
+        if self.original_image is None:
+            # Decode the full image first; processing resumes in full_image_loaded
+            source = self.source
+            self.process_pending = True
+            self.update_status("Decoding full resolution...")
+            source.request(lambda image: self.root.after(0, self.full_image_loaded, source, image))
+            return
+        
+        try:
+            params = self.outpaint_params()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        self.preview_worker.cancel()
+        job = self.job_queue.submit(self.original_image, params,
+                                    {'path': self.original_path,
+                                     'decode': self.source.decode_seconds})
+        
+        if self.processing:
+            self.update_status(f"Queued job #{job.id} ({self.job_queue.pending()} waiting)")
+            return
+        
         self.processing = True
         self.progress.start(10)
         self.update_status("Processing outpainting...")
-        
-        thread = threading.Thread(target=self.process_outpainting)
-        thread.daemon = True
-        thread.start()
     
-    def process_outpainting(self):
-        """Enhanced outpainting process"""
-        try:
-            # Get parameters
-            expansion_size = self.expansion_var.get()
-            direction = self.direction_var.get()
-            method = self.method_var.get()
-            
-            # Create expanded image and mask
-            expanded_image, mask = self.create_outpainting_mask(
-                self.original_image, expansion_size, direction
-            )
-            
-            # Apply inpainting
-            inpaint_method = cv2.INPAINT_TELEA if method == "telea" else cv2.INPAINT_NS
-            
-            # Perform inpainting with enhanced radius
-            inpaint_radius = max(3, expansion_size // 10)
-            self.processed_image = cv2.inpaint(expanded_image, mask, inpaint_radius, inpaint_method)
-            
-            # Apply enhancements
-            self.processed_image = self.enhance_image(self.processed_image)
-            
-            # Display result on main thread
-            self.root.after(0, self.display_result)
-            
-        except Exception as e:
-            self.root.after(0, lambda: self.handle_processing_error(str(e)))
+    def cancel_processing(self):
+        """Cancel the running job, queued jobs and any batch run"""
+        if not self.processing:
+            return
+        self.job_queue.cancel_all()
+        if self.batch_runner is not None:
+            self.batch_runner.stop()
+        self.update_status("Cancelling...")
+    
+    def job_finished(self, job):
+        """Handle a job that reached a final state"""
+        if not self.job_queue.busy():
+            self.progress.stop()
+            self.processing = False
+        
+        if job.state == DONE:
+            self.processed_image = job.result
+            self.display_result(job)
+        elif job.state == CANCELLED:
+            self.update_status(f"Job #{job.id} cancelled")
+        else:
+            self.metrics.error(f"{job.meta['path']}: {job.error}")
+            self.handle_processing_error(str(job.error))
     
-    def display_result(self):
+    def display_result(self, job):
         """Display processing result"""
         try:
-            # Convert BGR to RGB for display
-            rgb_processed = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2RGB)
+            timer = job.timer
+            timer.add("decode", job.meta.get('decode', 0.0))
             
-            # Display processed image
-            self.display_image(rgb_processed, self.processed_canvas)
+            with timer.stage("display"):
+                self.display_image(self.processed_image, self.processed_canvas)
             
-            # Stop progress bar
-            self.progress.stop()
-            self.processing = False
-            
-            # Auto-save if enabled
-            if self.auto_save_var.get():
-                self.auto_save_result()
+            self.metrics.count("images_processed")
             
             # Save current settings
             self.settings.update({
                 'last_expansion_size': self.expansion_var.get(),
                 'last_direction': self.direction_var.get(),
+                'last_fit': self.fit_var.get(),
                 'last_method': self.method_var.get(),
                 'auto_save': self.auto_save_var.get(),
-                'quality': self.quality_var.get()
+                'band_mode': self.band_mode_var.get(),
+                'tiled': self.tiled_var.get(),
+                'live_preview': self.live_preview_var.get(),
+                'enhance_margins_only': self.enhance_margins_only.get(),
+                'blend': self.blend_var.get(),
+                'quality': self.quality_var.get(),
+                'output_format': self.output_format_var.get(),
+                'png_compression': self.png_compression_var.get()
             })
             self.save_settings()
             
-            self.update_status("Outpainting completed successfully")
-            messagebox.showinfo("Success", "Outpainting completed successfully!")
+            # Auto-save if enabled; the job is reported once the file is written
+            if self.auto_save_var.get():
+                self.auto_save_result(job.meta['path'],
+                                      lambda filename, seconds: self.report_job(job, filename, seconds))
+            else:
+                self.report_job(job)
+            if not self.job_queue.busy():
+                messagebox.showinfo("Success", "Outpainting completed successfully!")
             
         except Exception as e:
             self.handle_processing_error(str(e))
     
+    def report_job(self, job, saved=None, encode_seconds=0.0):
+        """Record a finished job's stage times and show them"""
+        timer = job.timer
+        if saved is not None:
+            timer.add("encode", encode_seconds)
+        self.metrics.observe(timer, job=job.id, path=job.meta['path'])
+        
+        stats = self.result_cache.stats()
+        status = (f"Job #{job.id} completed in {job.duration:.1f}s: {timer.summary()} "
+                  f"(cache hits: {stats['hits']}, misses: {stats['misses']})")
+        if saved is not None:
+            status += f" | Auto-saved: {saved}"
+        self.update_status(status)
+    
+    def output_params(self, path):
+        """Encoder parameters from the quality settings"""
+        return encode_params(path, self.quality_var.get(), self.png_compression_var.get())
+    
     def handle_processing_error(self, error_msg):
         """Handle processing errors"""
-        self.progress.stop()
-        self.processing = False
+        if not self.job_queue.busy():
+            self.progress.stop()
+            self.processing = False
+        self.batch_runner = None
         self.update_status("Error during processing")
         messagebox.showerror("Error", f"Error during outpainting: {error_msg}")
     
-    def auto_save_result(self):
-        """Automatically save result to output folder"""
+    def auto_save_result(self, source_path=None, done=None):
+        """Automatically save result to output folder
+        
+        The image is encoded on the background writer; ``done(filename,
+        seconds)`` is called on the Tk thread once it is written.
+        """
         if self.processed_image is None:
             return
         
         try:
             # Generate filename with timestamp
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            original_name = os.path.splitext(os.path.basename(self.original_path))[0]
-            filename = f"{original_name}_outpainted_{timestamp}.png"
+            original_name = os.path.splitext(os.path.basename(source_path or self.original_path))[0]
+            extension = output_extension(self.output_format_var.get())
+            filename = f"{original_name}_outpainted_{timestamp}{extension}"
             filepath = os.path.join(self.folders['output'], filename)
             
             # Save with specified quality
-            if filepath.lower().endswith('.jpg') or filepath.lower().endswith('.jpeg'):
-                cv2.imwrite(filepath, self.processed_image, [cv2.IMWRITE_JPEG_QUALITY, self.quality_var.get()])
-            else:
-                cv2.imwrite(filepath, self.processed_image)
-            
-            self.update_status(f"Auto-saved: {filename}")
+            future = self.writer.submit(filepath, self.processed_image, self.output_params(filepath))
+            future.add_done_callback(lambda f: self.root.after(0, self.auto_save_finished, f, done))
             
         except Exception as e:
-            print(f"Auto-save error: {e}")
+            self.update_status(f"Auto-save error: {e}")
+    
+    def auto_save_finished(self, future, done=None):
+        """Account for a finished background write"""
+        try:
+            filepath, size, seconds = future.result()
+        except Exception as e:
+            self.update_status(f"Auto-save error: {e}")
+            return
+        self.metrics.count("bytes_written", size)
+        if done is not None:
+            done(os.path.basename(filepath), seconds)
+        else:
+            self.update_status(f"Auto-saved: {os.path.basename(filepath)}")
     
     def save_image(self):
         """Enhanced save functionality"""
@@ -553,7 +707,7 @@ class ImageOutpaintingApp:
         
         # Generate default filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        default_name = f"outpainted_{timestamp}.png"
+        default_name = f"outpainted_{timestamp}{output_extension(self.output_format_var.get())}"
         
         file_path = filedialog.asksaveasfilename(
             title="Save Outpainted Image",
@@ -562,6 +716,7 @@ class ImageOutpaintingApp:
             filetypes=[
                 ("PNG files", "*.png"),
                 ("JPEG files", "*.jpg"),
+                ("WebP files", "*.webp"),
                 ("All files", "*.*")
             ]
         )
@@ -569,10 +724,8 @@ class ImageOutpaintingApp:
         if file_path:
             try:
                 # Save with quality settings
-                if file_path.lower().endswith('.jpg') or file_path.lower().endswith('.jpeg'):
-                    cv2.imwrite(file_path, self.processed_image, [cv2.IMWRITE_JPEG_QUALITY, self.quality_var.get()])
-                else:
-                    cv2.imwrite(file_path, self.processed_image)
+                size = write_atomic(file_path, self.processed_image, self.output_params(file_path))
+                self.metrics.count("bytes_written", size)
                 
                 self.update_status(f"Saved: {os.path.basename(file_path)}")
                 messagebox.showinfo("Success", f"Image saved to {file_path}")
@@ -582,31 +735,51 @@ class ImageOutpaintingApp:
     
     def quick_preview(self):
         """Quick preview with lower quality for speed"""
-        if self.original_image is None:
+        if self.source is None:
             messagebox.showwarning("Warning", "Please load an image first")
             return
         
+        self.update_status("Generating preview...")
+        self.request_preview()
+    
+    def schedule_preview(self):
+        """Debounce live preview requests while parameters change"""
+        if not self.live_preview_var.get() or self.source is None:
+            return
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.root.after(PREVIEW_DEBOUNCE_MS, self.request_preview)
+    
+    def request_preview(self):
+        """Render a preview from the cached pyramid on the preview worker"""
+        self.preview_after_id = None
+        if self.source is None or self.processing:
+            return
+        
+        # Aspect-correct level matching the preview size
+        level = preview_level(self.preview_levels, self.settings['preview_size'])
         try:
-            # Create smaller version for quick preview
-            small_image = cv2.resize(self.original_image, (200, 150))
-            expansion = max(10, self.expansion_var.get() // 4)
-            
-            expanded_image, mask = self.create_outpainting_mask(small_image, expansion, self.direction_var.get())
-            method = cv2.INPAINT_TELEA if self.method_var.get() == "telea" else cv2.INPAINT_NS
-            
-            preview_result = cv2.inpaint(expanded_image, mask, 2, method)
-            rgb_preview = cv2.cvtColor(preview_result, cv2.COLOR_BGR2RGB)
-            
-            self.display_image(rgb_preview, self.processed_canvas)
-            self.update_status("Quick preview generated")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Preview error: {str(e)}")
+            params = preview_params(self.source.shape, level.shape, self.outpaint_params())
+        except ValueError as e:
+            self.update_status(f"Preview error: {e}")
+            return
+        self.preview_worker.submit(level, params)
+    
+    def show_preview(self, preview_result, error):
+        """Display a finished preview"""
+        if self.processing:
+            return
+        if error is not None:
+            self.update_status(f"Preview error: {error}")
+            return
+        
+        self.display_image(preview_result, self.processed_canvas)
+        self.update_status("Quick preview generated")
     
     def reset_image(self):
         """Reset to original image"""
-        if self.original_image is not None:
-            self.processed_canvas.delete("all")
+        if self.source is not None:
+            self.clear_canvas(self.processed_canvas)
             self.processed_image = None
             self.update_status("Reset to original")
     
@@ -650,7 +823,8 @@ class ImageOutpaintingApp:
             self.update_history()
             
         except Exception as e:
-            print(f"History error: {e}")
+            self.metrics.error(f"History: {e}", "history_errors")
+            self.update_status(f"Could not update history: {e}")
     
     def update_history(self):
         """Update history listbox"""
@@ -680,20 +854,13 @@ class ImageOutpaintingApp:
                     lines = f.readlines()
                     if index < len(lines):
                         filepath = lines[index].strip()
-                        if os.path.exists(filepath):
-                            self.original_path = filepath
-                            self.original_image = cv2.imread(filepath)
-                            if self.original_image is not None:
-                                rgb_image = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
-                                self.display_image(rgb_image, self.original_canvas)
-                                
-                                # Update image info
-                                h, w, c = self.original_image.shape
-                                file_size = os.path.getsize(filepath) / 1024
-                                self.info_label.config(text=f"Size: {w}x{h} | Channels: {c} | File: {file_size:.1f} KB")
-                                self.update_status("Image loaded from history")
+                        if os.path.exists(filepath) and self.open_image(filepath):
+                            self.clear_canvas(self.processed_canvas)
+                            self.processed_image = None
+                            self.update_status("Image loaded from history")
         except Exception as e:
-            print(f"Load from history error: {e}")
+            self.metrics.error(f"History: {e}", "history_errors")
+            self.update_status(f"Could not load from history: {e}")
     
     def batch_process(self):
         """Process all images in a folder"""
@@ -707,9 +874,8 @@ class ImageOutpaintingApp:
         
         try:
             # Get all image files
-            image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
-            image_files = [f for f in os.listdir(folder_path) 
-                          if f.lower().endswith(image_extensions)]
+            image_files = list_images(folder_path)
+            extension = output_extension(self.output_format_var.get())
             
             if not image_files:
                 messagebox.showwarning("Warning", "No image files found in selected folder")
@@ -721,45 +887,13 @@ class ImageOutpaintingApp:
             if not result:
                 return
             
-            # Process each image
-            processed_count = 0
-            for i, filename in enumerate(image_files):
-                try:
-                    filepath = os.path.join(folder_path, filename)
-                    self.update_status(f"Processing {i+1}/{len(image_files)}: {filename}")
-                    
-                    # Load image
-                    image = cv2.imread(filepath)
-                    if image is None:
-                        continue
-                    
-                    # Process outpainting
-                    expanded_image, mask = self.create_outpainting_mask(
-                        image, self.expansion_var.get(), self.direction_var.get()
-                    )
-                    
-                    method = cv2.INPAINT_TELEA if self.method_var.get() == "telea" else cv2.INPAINT_NS
-                    inpaint_radius = max(3, self.expansion_var.get() // 10)
-                    result_image = cv2.inpaint(expanded_image, mask, inpaint_radius, method)
-                    
-                    # Apply enhancements
-                    result_image = self.enhance_image(result_image)
-                    
-                    # Save result
-                    name_without_ext = os.path.splitext(filename)[0]
-                    output_filename = f"{name_without_ext}_batch_outpainted.png"
-                    output_path = os.path.join(self.folders['output'], output_filename)
-                    
-                    cv2.imwrite(output_path, result_image)
-                    processed_count += 1
-                    
-                except Exception as e:
-                    print(f"Error processing {filename}: {e}")
-                    continue
+            jobs = []
+            for filepath in image_files:
+                name_without_ext = os.path.splitext(os.path.basename(filepath))[0]
+                output_filename = f"{name_without_ext}_batch_outpainted{extension}"
+                jobs.append((filepath, os.path.join(self.folders['output'], output_filename)))
             
-            self.update_status(f"Batch processing completed: {processed_count} images")
-            messagebox.showinfo("Batch Complete", 
-                              f"Successfully processed {processed_count} out of {len(image_files)} images")
+            self.start_batch(jobs, "Batch processing", "Batch Complete")
             
         except Exception as e:
             messagebox.showerror("Error", f"Batch processing error: {str(e)}")
@@ -776,54 +910,98 @@ class ImageOutpaintingApp:
             return
         
         try:
-            processed_count = 0
-            for i, filepath in enumerate(file_paths):
-                try:
-                    filename = os.path.basename(filepath)
-                    self.update_status(f"Processing {i+1}/{len(file_paths)}: {filename}")
-                    
-                    # Load and process image
-                    image = cv2.imread(filepath)
-                    if image is None:
-                        continue
-                    
-                    expanded_image, mask = self.create_outpainting_mask(
-                        image, self.expansion_var.get(), self.direction_var.get()
-                    )
-                    
-                    method = cv2.INPAINT_TELEA if self.method_var.get() == "telea" else cv2.INPAINT_NS
-                    inpaint_radius = max(3, self.expansion_var.get() // 10)
-                    result_image = cv2.inpaint(expanded_image, mask, inpaint_radius, method)
-                    
-                    # Apply enhancements
-                    result_image = self.enhance_image(result_image)
-                    
-                    # Save result
-                    name_without_ext = os.path.splitext(filename)[0]
-                    timestamp = datetime.now().strftime("%H%M%S")
-                    output_filename = f"{name_without_ext}_multi_{timestamp}.png"
-                    output_path = os.path.join(self.folders['output'], output_filename)
-                    
-                    cv2.imwrite(output_path, result_image)
-                    processed_count += 1
-                    
-                except Exception as e:
-                    print(f"Error processing {filepath}: {e}")
-                    continue
+            timestamp = datetime.now().strftime("%H%M%S")
+            extension = output_extension(self.output_format_var.get())
+            jobs = []
+            for filepath in file_paths:
+                name_without_ext = os.path.splitext(os.path.basename(filepath))[0]
+                output_filename = f"{name_without_ext}_multi_{timestamp}{extension}"
+                jobs.append((filepath, os.path.join(self.folders['output'], output_filename)))
             
-            self.update_status(f"Multiple processing completed: {processed_count} images")
-            messagebox.showinfo("Processing Complete", 
-                              f"Successfully processed {processed_count} out of {len(file_paths)} images")
+            self.start_batch(jobs, "Multiple processing", "Processing Complete")
             
         except Exception as e:
             messagebox.showerror("Error", f"Multiple processing error: {str(e)}")
     
+    def start_batch(self, jobs, label, title):
+        """Run a batch on the pipelined runner without blocking the UI"""
+        if self.processing:
+            messagebox.showwarning("Warning", "Processing already in progress")
+            return
+        
+        try:
+            params = self.outpaint_params()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        self.processing = True
+        self.progress.start(10)
+        self.update_status(f"{label}: 0/{len(jobs)}")
+        
+        def report(done, total, path, error):
+            self.root.after(0, self.batch_progress, label, done, total, path, error)
+        
+        self.batch_metrics = Metrics()
+        writer = ImageWriter(self.quality_var.get(), self.png_compression_var.get())
+        policy = ThreadPolicy(self.settings['batch_threads'], self.settings['cpu_affinity'])
+        self.batch_runner = BatchRunner(params,
+                                        workers=self.settings['batch_workers'] or None,
+                                        progress=report, cache=self.result_cache,
+                                        metrics=self.batch_metrics, writer=writer,
+                                        executor=self.settings['batch_executor'], policy=policy)
+        
+        def work():
+            try:
+                result = self.batch_runner.run(jobs)
+                self.root.after(0, self.batch_finished, label, title, result)
+            except Exception as e:
+                self.root.after(0, self.handle_processing_error, str(e))
+            finally:
+                writer.close()
+        
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+    
+    def batch_progress(self, label, done, total, path, error):
+        """Show batch progress reported by the runner"""
+        failed = self.batch_metrics.snapshot()['counters']['images_failed']
+        note = f", {failed} failed" if failed else ""
+        self.update_status(f"{label}: {done}/{total}{note} {os.path.basename(path)}")
+    
+    def batch_finished(self, label, title, result):
+        """Report a finished batch run"""
+        self.progress.stop()
+        self.processing = False
+        self.batch_runner = None
+        
+        # Fold the batch into the session metrics and show its per-image breakdown
+        snapshot = self.batch_metrics.snapshot()
+        for name, value in snapshot['counters'].items():
+            self.metrics.count(name, value)
+        self.metrics.errors.extend(snapshot['errors'])
+        failed = snapshot['counters']['images_failed']
+        self.update_status(f"{label} completed: {result.processed} images, {failed} failed, "
+                           f"per image: {self.batch_metrics.mean_timer().summary()}")
+        message = f"Successfully processed {result.processed} out of {result.total} images"
+        if failed:
+            errors = "\n".join(snapshot['errors'][:MAX_SHOWN_ERRORS])
+            more = failed - min(failed, MAX_SHOWN_ERRORS)
+            message += f"\n\n{failed} failed:\n{errors}" + (f"\n...and {more} more" if more else "")
+        messagebox.showinfo(title, message)
+    
     def on_closing(self):
         """Handle application closing"""
         # Save settings
         self.save_settings()
         
         # Stop any ongoing processing
+        self.preview_worker.close()
+        self.job_queue.shutdown()
+        self.writer.close(wait=True)
+        if self.batch_runner is not None:
+            self.batch_runner.stop()
         if self.processing:
             self.processing = False
             self.progress.stop()
@@ -0,0 +1,48 @@
+"""Image outpainting engine and tooling."""
+from .backends import (
+    Backend,
+    backend_names,
+    get_backend,
+    inpaint_pyramid,
+    pyramid_levels,
+    register_backend,
+    registered_backends,
+    widest_margin,
+)
+from .engine import (
+    DEFAULT_TILE_SIZE,
+    DIRECTIONS,
+    MARGIN_PARAMS,
+    METHODS,
+    MODES,
+    CanvasBuilder,
+    aspect_margins,
+    band_margins,
+    band_width,
+    create_outpainting_mask,
+    enhance_image,
+    expand_canvas,
+    expansion_margins,
+    fill_canvas,
+    fit_margins,
+    inpaint_band,
+    inpaint_radius,
+    inpaint_tiled,
+    margin_params,
+    outpaint,
+    outpaint_margins,
+    output_shape,
+    parse_aspect,
+    parse_fit,
+    parse_margins,
+    parse_size,
+    solve,
+    thread_builder,
+)
+from .enhance import enhance_native, enhance_pil
+from .geometry import (
+    CanvasGeometry,
+    GeometryCache,
+    canvas_geometry,
+    tile_spans,
+)
@@ -0,0 +1,293 @@
+"""Registry of fill backends.
+
+A backend fills the masked pixels of a canvas (255 = unknown) and returns
+a new array. Each one declares a speed and quality profile, whether it can
+run on the tiles of the tiled executor and whether it may be called from
+several threads at once; the GUI and the CLI list whatever is registered
+here.
+
+Besides OpenCV's diffusion inpainters the registry ships fast
+non-iterative fillers for throughput-oriented jobs: border replication and
+reflection, a Gaussian-pyramid push-pull and an FFT-based harmonic
+(Poisson) extrapolation. The border and Poisson fillers assume the known
+pixels form a rectangle, as they do on outpainting canvases. For wide
+margins the PatchMatch backend (see patchmatch.py) synthesises texture
+from the original instead.
+"""
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+SPEEDS = ("fast", "medium", "slow")
+QUALITIES = ("low", "medium", "high")
+
+# Pyramid mode stops downsampling once the widest margin fits in this
+PYRAMID_COARSE_MARGIN = 16
+PYRAMID_MIN_SIZE = 16
+
+_registry = OrderedDict()
+
+
+class Backend:
+    """A named fill function with its profile"""
+
+    def __init__(self, name, fill, speed, quality, tiles=True, thread_safe=True, description="",
+                 options=()):
+        if speed not in SPEEDS:
+            raise ValueError(f"Unknown speed: {speed!r}")
+        if quality not in QUALITIES:
+            raise ValueError(f"Unknown quality: {quality!r}")
+        self.name = name
+        self.fill = fill
+        self.speed = speed
+        self.quality = quality
+        self.tiles = tiles
+        self.thread_safe = thread_safe
+        self.description = description
+        self.options = tuple(options)
+        self._lock = threading.Lock()
+
+    def __call__(self, canvas, mask, radius, **options):
+        # Options meant for other backends are ignored
+        options = {k: v for k, v in options.items() if k in self.options and v is not None}
+        if self.thread_safe:
+            return self.fill(canvas, mask, radius, **options)
+        with self._lock:
+            return self.fill(canvas, mask, radius, **options)
+
+    @property
+    def profile(self):
+        """Short human readable summary of the profile"""
+        notes = [f"speed: {self.speed}", f"quality: {self.quality}"]
+        if not self.tiles:
+            notes.append("no tiles")
+        if not self.thread_safe:
+            notes.append("serialised")
+        return ", ".join(notes)
+
+    def __repr__(self):
+        return f"Backend({self.name!r}, {self.profile})"
+
+
+def register_backend(name, fill, speed, quality, tiles=True, thread_safe=True, description="",
+                     options=()):
+    """Add or replace a backend and return it
+
+    ``options`` names the keyword arguments ``fill`` accepts on top of
+    (canvas, mask, radius).
+    """
+    backend = Backend(name, fill, speed, quality, tiles, thread_safe, description, options)
+    _registry[name] = backend
+    return backend
+
+
+def get_backend(name):
+    """Registered backend by name"""
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError(f"Unknown inpainting method: {name!r}") from None
+
+
+def backend_names():
+    """Names of the registered backends, in registration order"""
+    return tuple(_registry)
+
+
+def registered_backends():
+    """Registered backends, in registration order"""
+    return list(_registry.values())
+
+
+def known_box(mask):
+    """Bounding box (y0, y1, x0, x1) of the known pixels, or None"""
+    x, y, w, h = cv2.boundingRect(cv2.bitwise_not(mask))
+    if not w or not h:
+        return None
+    return y, y + h, x, x + w
+
+
+def widest_margin(mask):
+    """Widest masked margin around the known region of a mask"""
+    h, w = mask.shape[:2]
+    x, y, known_w, known_h = cv2.boundingRect(cv2.bitwise_not(mask))
+    return max(y, h - (y + known_h), x, w - (x + known_w))
+
+
+def pyramid_levels(shape, margin):
+    """Number of 2x downsampling steps used by the pyramid method"""
+    h, w = shape[:2]
+    levels = 0
+    while ((margin >> levels) > PYRAMID_COARSE_MARGIN and
+           min(h, w) >> (levels + 1) >= PYRAMID_MIN_SIZE):
+        levels += 1
+    return levels
+
+
+def inpaint_pyramid(expanded_image, mask, radius, flag=cv2.INPAINT_TELEA, levels=None):
+    """Coarse-to-fine inpainting
+
+    The canvas is solved at the coarsest level, where the margin is only a
+    few pixels wide; each finer level is initialised with the upsampled
+    solution and only a narrow masked band next to the known pixels is
+    inpainted again to restore detail at the seam.
+    """
+    if levels is None:
+        levels = pyramid_levels(mask.shape, widest_margin(mask))
+
+    # Build the pyramid; any partially masked pixel stays masked
+    images = [expanded_image]
+    masks = [mask]
+    for _ in range(levels):
+        h, w = masks[-1].shape
+        size = (max(1, w // 2), max(1, h // 2))
+        images.append(cv2.resize(images[-1], size, interpolation=cv2.INTER_AREA))
+        masks.append(np.where(cv2.resize(masks[-1], size, interpolation=cv2.INTER_AREA) > 0,
+                              np.uint8(255), np.uint8(0)))
+
+    # Full solve at the coarsest level
+    level_radius = max(3, radius >> levels)
+    result = cv2.inpaint(images[-1], masks[-1], level_radius, flag)
+
+    for level in range(levels - 1, -1, -1):
+        image, level_mask = images[level], masks[level]
+        h, w = level_mask.shape
+
+        # Upsampled solution initialises the masked area
+        upsampled = cv2.resize(result, (w, h), interpolation=cv2.INTER_LINEAR)
+        result = image.copy()
+        masked = level_mask > 0
+        result[masked] = upsampled[masked]
+
+        # Refine only the band of masked pixels next to the known region
+        level_radius = max(3, radius >> level)
+        size = 2 * level_radius + 1
+        near_known = cv2.dilate(255 - level_mask, np.ones((size, size), np.uint8))
+        band = cv2.bitwise_and(level_mask, near_known)
+        result = cv2.inpaint(result, band, level_radius, flag)
+
+    return result
+
+
+def fill_border(canvas, mask, border):
+    """Extend the known rectangle to the canvas edges with a border mode"""
+    box = known_box(mask)
+    if box is None:
+        return canvas.copy()
+    y0, y1, x0, x1 = box
+    h, w = mask.shape[:2]
+    known = canvas[y0:y1, x0:x1]
+    if border == cv2.BORDER_REFLECT_101 and min(known.shape[:2]) < 2:
+        border = cv2.BORDER_REPLICATE
+    return cv2.copyMakeBorder(known, y0, h - y1, x0, w - x1, border)
+
+
+def fill_push_pull(canvas, mask, radius=None):
+    """Gaussian-pyramid push-pull fill
+
+    Known pixels are pulled down a Gaussian pyramid as weighted averages
+    until no holes are left, then pushed back up, each level filling its
+    unknown share from the upsampled coarser level.
+    """
+    weights = (mask == 0).astype(np.float32)
+    colors = canvas.astype(np.float32) * weights[..., None]
+
+    # Pull: premultiplied colours and coverage at every level
+    levels = [(colors, weights)]
+    while weights.min() == 0 and min(weights.shape) > 1:
+        colors = cv2.pyrDown(colors)
+        weights = cv2.pyrDown(weights)
+        levels.append((colors, weights))
+
+    # Push: normalise the coarsest level, then fill holes level by level
+    filled = colors / np.maximum(weights, 1e-6)[..., None]
+    for colors, weights in reversed(levels[:-1]):
+        h, w = weights.shape
+        upsampled = cv2.pyrUp(filled, dstsize=(w, h))
+        filled = colors + upsampled * (1 - np.minimum(weights, 1))[..., None]
+
+    result = np.clip(filled, 0, 255, out=filled).astype(np.uint8)
+    known = mask == 0
+    result[known] = canvas[known]
+    return result
+
+
+def harmonic_strip(edge, depth):
+    """Harmonic extension of an edge row into a strip ``depth`` rows deep
+
+    Solves Laplace's equation on the strip with the edge values at the
+    seam and zero normal derivative at the far side and the ends, in
+    closed form per cosine frequency: a feature of wavelength L decays
+    like exp(-2 pi d / L) with the distance d from the seam, so detail
+    fades smoothly into the local mean. Returns ``depth`` float32 rows,
+    nearest to the seam first.
+    """
+    n = edge.shape[0]
+    # Even extension makes the FFT a cosine transform with Neumann ends
+    spectrum = np.fft.rfft(np.concatenate([edge, edge[::-1]]).astype(np.float32), axis=0)
+    omega = np.pi * np.arange(spectrum.shape[0]) / n
+    d = np.arange(1, depth + 1, dtype=np.float64)[:, None]
+    decay = ((np.exp(-omega * d) + np.exp(-omega * (2 * depth - d))) /
+             (1 + np.exp(-2 * omega * depth)))
+    rows = np.fft.irfft(spectrum[None] * decay[..., None], n=2 * n, axis=1)[:, :n]
+    return rows.astype(np.float32)
+
+
+def fill_poisson(canvas, mask, radius=None):
+    """FFT-based harmonic extrapolation of the known rectangle
+
+    Left and right margins are extended from the known columns first, then
+    top and bottom margins from the full-width rows, which fills corners.
+    """
+    box = known_box(mask)
+    if box is None:
+        return canvas.copy()
+    y0, y1, x0, x1 = box
+    h, w = mask.shape[:2]
+    result = canvas.copy()
+
+    def extend(edge, depth):
+        return np.clip(harmonic_strip(edge, depth) + 0.5, 0, 255).astype(np.uint8)
+
+    if x0:
+        result[y0:y1, :x0] = extend(result[y0:y1, x0], x0)[::-1].transpose(1, 0, 2)
+    if x1 < w:
+        result[y0:y1, x1:] = extend(result[y0:y1, x1 - 1], w - x1).transpose(1, 0, 2)
+    if y0:
+        result[:y0] = extend(result[y0], y0)[::-1]
+    if y1 < h:
+        result[y1:] = extend(result[y1 - 1], h - y1)
+    return result
+
+
+def _fill_patchmatch(canvas, mask, radius, **options):
+    # NumPy-heavy module, only imported when the backend is used
+    from .patchmatch import fill_patchmatch
+    return fill_patchmatch(canvas, mask, radius, **options)
+
+
+def _fill_inpaint(flag):
+    def fill(canvas, mask, radius):
+        return cv2.inpaint(canvas, mask, radius, flag)
+    return fill
+
+
+register_backend("telea", _fill_inpaint(cv2.INPAINT_TELEA), "slow", "high",
+                 description="OpenCV fast marching (Telea)")
+register_backend("ns", _fill_inpaint(cv2.INPAINT_NS), "slow", "high",
+                 description="OpenCV Navier-Stokes")
+register_backend("pyramid", lambda canvas, mask, radius: inpaint_pyramid(canvas, mask, radius),
+                 "medium", "medium", description="Telea coarse-to-fine")
+register_backend("patchmatch", _fill_patchmatch, "slow", "high", tiles=False,
+                 description="PatchMatch texture synthesis",
+                 options=("patch_size", "iterations", "multiscale", "time_budget", "seed"))
+register_backend("poisson", fill_poisson, "fast", "medium",
+                 description="FFT harmonic extrapolation")
+register_backend("pushpull", fill_push_pull, "fast", "low",
+                 description="Gaussian-pyramid push-pull")
+register_backend("replicate", lambda canvas, mask, radius: fill_border(canvas, mask, cv2.BORDER_REPLICATE),
+                 "fast", "low", description="Repeat the edge pixels")
+register_backend("reflect", lambda canvas, mask, radius: fill_border(canvas, mask, cv2.BORDER_REFLECT_101),
+                 "fast", "low", description="Mirror the image at its edges")
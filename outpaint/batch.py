@@ -0,0 +1,302 @@
+"""Pipelined batch runner.
+
+Decode, compute and encode run as separate stages: a reader thread decodes
+images and submits them to a worker pool, the calling thread collects the
+results in submission order and hands them to a writer thread pool. A
+bounded number of images in flight keeps memory flat regardless of batch
+size. Process workers get their pixels and return results in shared
+memory blocks (see shared.py), so results are never pickled; thread
+workers share the arrays directly. The OpenCV threads and CPU affinity
+of each worker follow a tuning.ThreadPolicy.
+"""
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from . import engine
+from .cache import cache_key
+from .manifest import content_hash
+from .metrics import StageTimer
+from .output import ImageWriter
+from .shared import SharedArray, can_share
+from .tuning import EXECUTORS, make_pool, pool_params
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp')
+
+# Sentinel closing the decode -> encode queue
+_DONE = object()
+
+
+class BatchResult:
+    """Counts and failures of a finished batch run"""
+
+    def __init__(self, total):
+        self.total = total
+        self.processed = 0
+        self.failed = []
+
+    def __repr__(self):
+        return f"BatchResult(processed={self.processed}, failed={len(self.failed)}, total={self.total})"
+
+
+class BatchRunner:
+    """Run engine.outpaint over many files with a worker pool
+
+    ``params`` are keyword arguments for engine.outpaint. ``progress`` is
+    called from the runner thread as progress(done, total, input_path, error)
+    with error None on success; GUIs must marshal it to their own thread.
+    Completed inputs are appended to ``manifest`` when one is given, and
+    results are looked up in and stored to ``cache`` (a ResultCache).
+    Per-image stage times and counters go to ``metrics`` (metrics.Metrics).
+    Results are written atomically by ``writer`` (an output.ImageWriter,
+    PNG defaults when omitted) while the next images are being computed.
+    ``executor`` runs the workers as processes or threads, and ``policy``
+    (a tuning.ThreadPolicy) sets their OpenCV threads and CPU affinity.
+    """
+
+    def __init__(self, params, workers=None, queue_size=None, progress=None, manifest=None,
+                 cache=None, metrics=None, writer=None, executor="process", policy=None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor: {executor!r}")
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = policy.for_workers(self.workers) if policy is not None else None
+        self.params = pool_params(params, self.policy)
+        self.executor = executor
+        self.queue_size = queue_size or 2 * self.workers
+        self.progress = progress
+        self.manifest = manifest
+        self.cache = cache
+        self.metrics = metrics
+        self.writer = writer
+        self._stop = threading.Event()
+        self._reader_error = None
+
+    def stop(self):
+        """Stop submitting new work; images in flight still finish"""
+        self._stop.set()
+
+    def run(self, jobs):
+        """Process (input_path, output_path) pairs and return a BatchResult"""
+        total = len(jobs) if hasattr(jobs, '__len__') else None
+        result = BatchResult(total)
+        slots = threading.BoundedSemaphore(self.queue_size)
+        pending = queue.Queue(maxsize=self.queue_size)
+        writer = self.writer or ImageWriter()
+        writes = deque()
+        # Thread workers set OpenCV's threads for the whole process
+        saved_threads = cv2.getNumThreads()
+
+        try:
+            with make_pool(self.executor, self.workers, self.policy) as pool:
+                reader = threading.Thread(target=self._decode, args=(jobs, pool, slots, pending),
+                                          daemon=True)
+                reader.start()
+
+                while True:
+                    item = pending.get()
+                    if item is _DONE:
+                        break
+                    input_path, output_path, digest, key, timer, future = item
+                    image = None
+                    try:
+                        if isinstance(future, Exception):
+                            raise future
+                        image, times = future.result()
+                        timer.update(times)
+                        write = writer.submit(output_path, image)
+                    except Exception as e:
+                        write = Future()
+                        write.set_exception(e)
+                    # The slot frees up as soon as the image is on disk
+                    write.add_done_callback(lambda _: slots.release())
+                    writes.append((input_path, output_path, digest, key, timer, image, write))
+
+                    # Report finished writes in submission order
+                    while writes and writes[0][-1].done():
+                        self._finish(writes.popleft(), result)
+
+                while writes:
+                    self._finish(writes.popleft(), result)
+                reader.join()
+                if self._reader_error is not None:
+                    error, self._reader_error = self._reader_error, None
+                    raise error
+        finally:
+            if self.writer is None:
+                writer.close()
+            cv2.setNumThreads(saved_threads)
+
+        return result
+
+    def _finish(self, entry, result):
+        """Wait for one image's write, then record and report it"""
+        input_path, output_path, digest, key, timer, image, write = entry
+        written = 0
+        try:
+            _, written, seconds = write.result()
+            timer.add("encode", seconds)
+            if key is not None:
+                self.cache.put(key, image)
+            if self.manifest is not None:
+                self.manifest.record(input_path, output_path, digest)
+            result.processed += 1
+            error = None
+        except Exception as e:
+            result.failed.append((input_path, str(e)))
+            error = e
+        self._observe(timer, input_path, output_path, written, error)
+
+        if self.progress:
+            self.progress(result.processed + len(result.failed), result.total, input_path, error)
+
+    def _observe(self, timer, input_path, output_path, written, error):
+        """Record one finished image in the metrics"""
+        if self.metrics is None:
+            return
+        if error is None:
+            self.metrics.count("images_processed")
+            self.metrics.count("bytes_written", written)
+            try:
+                self.metrics.count("bytes_read", os.path.getsize(input_path))
+            except OSError:
+                pass
+            self.metrics.observe(timer, input=input_path, output=output_path)
+        else:
+            self.metrics.error(f"{input_path}: {error}")
+            self.metrics.observe(timer, input=input_path, error=str(error))
+
+    def _submit(self, pool, image):
+        """Start outpainting an image; the future resolves to (result, stage times)"""
+        if self.executor == "thread":
+            return pool.submit(outpaint_task, image, self.params)
+        try:
+            shape = engine.output_shape(image.shape, **engine.margin_params(self.params))
+        except ValueError:
+            # Unreachable margins; the worker reports the error for this image
+            return pool.submit(outpaint_task, image, self.params)
+        if not can_share(image.nbytes + int(np.prod(shape))):
+            return pool.submit(outpaint_task, image, self.params)
+
+        source = SharedArray.copy_of(image)
+        target = SharedArray.create(shape, np.uint8)
+        future = Future()
+
+        def finished(task):
+            try:
+                future.set_result((target.array, task.result()))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                # The result array keeps the block mapped after close()
+                source.close()
+                target.close()
+
+        try:
+            task = pool.submit(outpaint_shared_task, source.handle, target.handle, self.params)
+        except BaseException:
+            source.close()
+            target.close()
+            raise
+        task.add_done_callback(finished)
+        return future
+
+    def _decode(self, jobs, pool, slots, pending):
+        """Reader stage: decode inputs and hand them to the pool"""
+        try:
+            for input_path, output_path in jobs:
+                if self._stop.is_set():
+                    break
+                slots.acquire()
+                timer = StageTimer()
+                try:
+                    with timer.stage("decode"):
+                        image, digest = read_image(input_path, self.manifest is not None)
+                except (OSError, cv2.error) as e:
+                    pending.put((input_path, output_path, None, None, timer, e))
+                    continue
+
+                # Cache hits skip the pool; misses carry their key to the encoder
+                key = None
+                try:
+                    if self.cache is not None:
+                        key = cache_key(image, self.params)
+                        cached = self.cache.get(key)
+                        if cached is not None:
+                            future = Future()
+                            future.set_result((cached, {}))
+                            pending.put((input_path, output_path, digest, None, timer, future))
+                            continue
+                    # Shared blocks can fail to allocate, e.g. once /dev/shm fills up
+                    future = self._submit(pool, image)
+                except Exception as e:
+                    pending.put((input_path, output_path, digest, None, timer, e))
+                    continue
+                pending.put((input_path, output_path, digest, key, timer, future))
+        except BaseException as e:
+            # Anything else ends the run; run() re-raises it
+            self._reader_error = e
+        finally:
+            pending.put(_DONE)
+
+
+def outpaint_task(image, params):
+    """Pool task: outpaint reusing this worker's canvas and mask buffers
+
+    Returns the result and its stage times.
+    """
+    timer = StageTimer()
+    result = engine.outpaint(image, builder=engine.thread_builder(), timer=timer, **params)
+    return result, timer.times
+
+
+def outpaint_shared_task(source, target, params):
+    """Pool task: outpaint the image in the ``source`` block into ``target``
+
+    Both are SharedArray handles; only the stage times are returned.
+    """
+    blocks = [SharedArray.attach(source), SharedArray.attach(target)]
+    try:
+        timer = StageTimer()
+        result = engine.outpaint(blocks[0].array, builder=engine.thread_builder(), timer=timer,
+                                 **params)
+        blocks[1].array[...] = result
+        return timer.times
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def read_image(path, with_hash=False):
+    """Decode an image from one read of the file, optionally hashing it"""
+    data = np.fromfile(path, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    if image is None:
+        raise IOError(f"Could not read {path}")
+    return image, content_hash(data) if with_hash else None
+
+
+def scan_images(folder, recursive=True):
+    """Lazily yield image files under a folder, in name order per directory"""
+    try:
+        with os.scandir(folder) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return
+    subfolders = []
+    for entry in entries:
+        if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield entry.path
+        elif recursive and entry.is_dir(follow_symlinks=False):
+            subfolders.append(entry.path)
+    for subfolder in subfolders:
+        yield from scan_images(subfolder, recursive)
+
+
+def list_images(folder):
+    """Image files directly inside a folder"""
+    return list(scan_images(folder, recursive=False))
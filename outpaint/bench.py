@@ -0,0 +1,328 @@
+"""Benchmarks for the outpainting hot paths.
+
+Every case outpaints a synthetic image of a given size with one
+expansion, direction, method and engine path (the full canvas, the band
+mode, the tiled executor, seam blending or the memory-budgeted path)
+through engine.outpaint, timing each stage the app runs (mask creation,
+inpainting, blending, enhancement, display scaling and PNG encoding).
+Backends with a time budget, like PatchMatch, run with one.
+Cases run one at a time in fresh child processes so their peak RSS is
+their own. Results are plain JSON that later runs can be compared to:
+
+    python -m outpaint bench --output base.json
+    python -m outpaint bench --compare base.json --threshold 0.2
+    python -m outpaint bench --paths full,band,tiled,blend,budget
+
+Quality cases crop the middle of a periodic texture, outpaint it back to
+the full size and report the mean absolute error of the margins against
+the texture, plus the horizontal gradient energy of the top margin (how
+much texture survives) next to the texture's own:
+
+    python -m outpaint bench --quality --methods telea,poisson,patchmatch
+
+Everything is generated locally; no network or GPU is needed.
+"""
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from . import engine
+from .backends import backend_names, get_backend
+from .display import display_frame, fit_size
+from .memory import estimate_peak_bytes
+from .metrics import StageTimer
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+SIZES_MP = (0.3, 1, 4)
+FULL_SIZES_MP = (0.3, 1, 4, 12, 24, 50)
+EXPANSIONS = (50, 150)
+DIRECTIONS = ("all", "horizontal")
+
+# engine.outpaint options of each benchmarked path; the budget path gets
+# a memory budget of BUDGET_FRACTION of its estimated peak
+PATH_OPTIONS = {
+    'full': {},
+    'band': {'mode': "band"},
+    'tiled': {'tile_size': engine.DEFAULT_TILE_SIZE},
+    'blend': {'blend': "feather"},
+    'budget': {}
+}
+PATHS = ("full",)
+BUDGET_FRACTION = 0.5
+
+# Paths that only differ from 'full' for backends that run on tiles
+TILED_PATHS = ("tiled", "budget")
+
+# Seconds per image for backends that accept a time budget
+TIME_BUDGET = 10.0
+
+# Display stage scales into a canvas of this size, like the GUI panels
+DISPLAY_SIZE = (800, 600)
+
+DEFAULT_TIMEOUT = 600
+DEFAULT_THRESHOLD = 0.2
+
+# Changes smaller than this are noise, whatever the ratio
+MIN_DELTA = {'total': 0.005, 'peak_rss_mb': 5, 'mae': 0.5}
+
+# Quality cases: input size (h, w) and the expansion scored against the texture
+QUALITY_SHAPE = (600, 800)
+QUALITY_EXPANSION = 150
+
+STAGES = ("mask", "inpaint", "blend", "enhance", "display", "encode")
+
+
+def synthetic_image(megapixels, seed=0):
+    """Deterministic 4:3 BGR test image with smooth structure and grain"""
+    h = max(8, int(round((megapixels * 1e6 * 3 / 4) ** 0.5)))
+    w = max(8, int(round(h * 4 / 3)))
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(2, h // 32), max(2, w // 32), 3), dtype=np.uint8)
+    image = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC)
+    grain = rng.integers(0, 16, (h, w, 3), dtype=np.uint8)
+    return cv2.add(image, grain)
+
+
+def periodic_texture(shape, seed=0):
+    """Deterministic BGR texture: a tiled random patch over diagonal stripes"""
+    h, w = shape
+    rng = np.random.default_rng(seed)
+    tile = cv2.GaussianBlur(rng.integers(0, 96, (32, 32, 3), dtype=np.uint8), (3, 3), 0)
+    image = np.tile(tile, (h // 32 + 1, w // 32 + 1, 1))[:h, :w].astype(np.float32)
+    yy, xx = np.mgrid[0:h, 0:w]
+    stripes = 80 + 60 * np.sin(2 * np.pi * (xx / 47 + yy / 113))
+    image += stripes[..., None] * np.array([1.0, 0.8, 0.6], dtype=np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def case_id(case):
+    """Stable name of a case, used to match runs when comparing"""
+    if case.get('kind') == 'quality':
+        budget = f"-t{case['time_budget']}" if case.get('time_budget') else ""
+        return f"quality-e{case['expansion']}-{case['method']}{budget}"
+    path = f"-{case['path']}" if case.get('path', 'full') != 'full' else ""
+    budget = f"-t{case['time_budget']}" if case.get('time_budget') else ""
+    return (f"{case['megapixels']}MP-e{case['expansion']}-{case['direction']}-{case['method']}"
+            f"{path}{budget}")
+
+
+def _time_budget(method, time_budget):
+    """``time_budget`` for backends that accept one, else None"""
+    return time_budget if 'time_budget' in get_backend(method).options else None
+
+
+def build_cases(sizes=SIZES_MP, expansions=EXPANSIONS, directions=DIRECTIONS, methods=None,
+                paths=PATHS, time_budget=TIME_BUDGET):
+    """Cross product of the benchmark dimensions
+
+    Tiled paths are skipped for backends without tiles, which would run
+    the full path (or be refused by the memory budget) instead.
+    """
+    methods = methods or backend_names()
+    return [{'megapixels': mp, 'expansion': e, 'direction': d, 'method': m, 'path': p,
+             'time_budget': _time_budget(m, time_budget)}
+            for mp, e, d, m, p in itertools.product(sizes, expansions, directions, methods, paths)
+            if p not in TILED_PATHS or get_backend(m).tiles]
+
+
+def build_quality_cases(methods=None, expansion=QUALITY_EXPANSION, time_budget=TIME_BUDGET):
+    """One ground-truth quality case per method"""
+    return [{'kind': 'quality', 'expansion': expansion, 'method': m,
+             'time_budget': _time_budget(m, time_budget)}
+            for m in methods or backend_names()]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def case_options(case, shape):
+    """engine.outpaint keyword arguments of a case for an input of ``shape``"""
+    path = case.get('path', 'full')
+    options = dict(PATH_OPTIONS[path], contrast=True, sharpness=True,
+                   backend_options={'time_budget': case.get('time_budget')})
+    if path == 'budget':
+        margins = engine.expansion_margins(case['expansion'], case['direction'])
+        peak = estimate_peak_bytes(shape, margins, engine.inpaint_radius(case['expansion']),
+                                   enhance=True, method=case['method'])
+        options['memory_budget'] = int(peak * BUDGET_FRACTION)
+    return options
+
+
+def run_case(case, repeat=1):
+    """Time each stage of one case in this process; best of ``repeat``"""
+    image = synthetic_image(case['megapixels'])
+    options = case_options(case, image.shape)
+    best = None
+
+    for _ in range(repeat):
+        timer = StageTimer()
+        result = engine.outpaint(image, case['expansion'], case['direction'], case['method'],
+                                 timer=timer, **options)
+
+        # Same scaling as the GUI's display_image, without a Tk canvas
+        with timer.stage("display"):
+            display_frame(result, fit_size(result.shape, DISPLAY_SIZE))
+
+        with timer.stage("encode"):
+            ok, _ = cv2.imencode('.png', result)
+        if not ok:
+            raise RuntimeError("PNG encoding failed")
+
+        times = dict(timer.times, total=timer.total)
+        if best is None or times['total'] < best['total']:
+            best = times
+
+    out_mp = result.shape[0] * result.shape[1] / 1e6
+    rss = peak_rss_mb()
+    return {
+        'id': case_id(case),
+        **case,
+        'input_shape': list(image.shape[:2]),
+        'output_mp': round(out_mp, 3),
+        'stages': {stage: round(best[stage], 5) for stage in STAGES if stage in best},
+        'total': round(best['total'], 5),
+        'mp_per_s': round(out_mp / best['total'], 3) if best['total'] else None,
+        'peak_rss_mb': None if rss is None else round(rss, 1)
+    }
+
+
+def run_quality_case(case, repeat=1):
+    """Outpaint the middle of a texture and score the margins against it"""
+    e = case['expansion']
+    h, w = QUALITY_SHAPE
+    truth = periodic_texture((h + 2 * e, w + 2 * e))
+    options = {'time_budget': case.get('time_budget')}
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = engine.outpaint(truth[e:e + h, e:e + w], e, "all", case['method'],
+                                 backend_options=options)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    margins = np.ones(truth.shape[:2], dtype=bool)
+    margins[e:e + h, e:e + w] = False
+    error = np.abs(result.astype(np.int16) - truth.astype(np.int16))[margins]
+
+    def gradient(image):
+        return float(np.abs(np.diff(image[:e].astype(np.float32), axis=1)).mean())
+
+    out_mp = result.shape[0] * result.shape[1] / 1e6
+    rss = peak_rss_mb()
+    return {
+        'id': case_id(case),
+        **case,
+        'output_mp': round(out_mp, 3),
+        'total': round(best, 5),
+        'mp_per_s': round(out_mp / best, 3) if best else None,
+        'mae': round(float(error.mean()), 2),
+        'gradient': round(gradient(result), 2),
+        'truth_gradient': round(gradient(truth), 2),
+        'peak_rss_mb': None if rss is None else round(rss, 1)
+    }
+
+
+def _child_case(conn, case, repeat):
+    """Child process entry point: run one case and send back the record"""
+    try:
+        run = run_quality_case if case.get('kind') == 'quality' else run_case
+        conn.send((run(case, repeat), None))
+    except Exception as e:
+        conn.send((None, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def measure(case, repeat=1, timeout=DEFAULT_TIMEOUT):
+    """Run a case in a fresh process; failures and timeouts become records"""
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_child_case, args=(child_conn, case, repeat), daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if parent_conn.poll(timeout):
+            record, error = parent_conn.recv()
+        else:
+            record, error = None, f"timed out after {timeout}s"
+            process.terminate()
+    except EOFError:
+        record, error = None, "worker process died"
+    finally:
+        parent_conn.close()
+        process.join()
+
+    if record is None:
+        record = {'id': case_id(case), **case, 'error': error or f"exit code {process.exitcode}"}
+    return record
+
+
+def environment():
+    """Versions and hardware the numbers were taken on"""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def run_benchmarks(cases, repeat=1, timeout=DEFAULT_TIMEOUT, progress=None):
+    """Measure every case; ``progress(record)`` is called after each one"""
+    records = []
+    for case in cases:
+        record = measure(case, repeat, timeout)
+        records.append(record)
+        if progress:
+            progress(record)
+    return {'environment': environment(), 'cases': records}
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Cases that got slower, bigger or less accurate than the baseline by more than ``threshold``
+
+    Returns (case id, metric, baseline value, new value) tuples; cases
+    missing from either run or failed in either run are not compared.
+    """
+    previous = {record['id']: record for record in baseline['cases'] if 'error' not in record}
+    regressions = []
+    for record in results['cases']:
+        old = previous.get(record['id'])
+        if old is None or 'error' in record:
+            continue
+        for metric, min_delta in MIN_DELTA.items():
+            if not old.get(metric) or record.get(metric) is None:
+                continue
+            if record[metric] > old[metric] * (1 + threshold) and record[metric] - old[metric] > min_delta:
+                regressions.append((record['id'], metric, old[metric], record[metric]))
+    return regressions
@@ -0,0 +1,142 @@
+"""Content-addressed on-disk cache of outpainting results.
+
+Entries are keyed on a hash of the input pixels plus the parameters that
+change the output, stored as raw .npy files and evicted least recently
+used first once the cache grows past its size budget.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import engine
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Parameters that do not change the result and stay out of the key
+_IGNORED_PARAMS = ('workers', 'builder', 'temp_dir', 'timer')
+
+
+def image_digest(image):
+    """Hash of an image's pixels, shape and dtype"""
+    image = np.ascontiguousarray(image)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.shape}{image.dtype}".encode())
+    h.update(memoryview(image).cast('B'))
+    return h.hexdigest()
+
+
+def cache_key(image, params, digest=None):
+    """Cache key for an input image and engine parameters"""
+    params = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+    h = hashlib.blake2b(digest_size=16)
+    h.update((digest or image_digest(image)).encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """LRU cache of outpainted images on disk"""
+
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        os.makedirs(folder, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Index existing entries, oldest access first"""
+        found = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.npy'):
+                    st = entry.stat()
+                    found.append((st.st_mtime, entry.name[:-4], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.npy')
+
+    def get(self, key):
+        """Cached result for a key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            result = np.load(self._path(key))
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key, image):
+        """Store a result, evicting old entries beyond the size budget"""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, image)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        size = os.path.getsize(path)
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def outpaint(self, image, **params):
+        """engine.outpaint with results served from the cache when possible"""
+        key = cache_key(image, params)
+        result = self.get(key)
+        if result is None:
+            result = engine.outpaint(image, **params)
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            for key in self._entries:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._size
+            }
@@ -0,0 +1,444 @@
+"""Command-line entry point for headless batch runs.
+
+    python -m outpaint batch IN_DIR OUT_DIR --expansion 160 --method ns --workers 8
+    python -m outpaint batch IN_DIR OUT_DIR --aspect 16:9 --direction horizontal
+    python -m outpaint batch IN_DIR OUT_DIR --recursive --resume
+    find scans -name '*.jpg' | python -m outpaint batch - OUT_DIR
+    python -m outpaint backends
+    python -m outpaint bench --sizes 0.3,1,4 --output base.json
+    python -m outpaint bench --full --compare base.json --threshold 0.2
+    python -m outpaint bench --paths full,band,tiled,blend,budget
+    python -m outpaint serve --port 8765 --workers 4
+    python -m outpaint tune --seconds 3
+    python -m outpaint batch IN_DIR OUT_DIR --executor thread --workers 4 --threads 2 --affinity pin
+
+Defaults come from the same config.json keys the GUI uses.
+"""
+import argparse
+import os
+import sys
+
+from . import bench, engine, server, tuning
+from .backends import backend_names, registered_backends
+from .batch import BatchRunner, scan_images
+from .blend import BLEND_MODES
+from .cache import ResultCache
+from .manifest import MANIFEST_NAME, Manifest
+from .metrics import Metrics
+from .output import DEFAULT_WRITERS, OUTPUT_FORMATS, ImageWriter, output_extension
+from .settings import load_settings, save_settings, settings_path
+
+# Exit statuses
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def iter_inputs(source, recursive=False):
+    """Yield input paths from a directory, or one per line from stdin for '-'"""
+    if source == '-':
+        for line in sys.stdin:
+            path = line.strip()
+            if path:
+                yield path
+        return
+    yield from scan_images(source, recursive)
+
+
+def output_path(input_path, out_dir, root=None, ext='.png', tag=''):
+    """Output file for an input, named like the GUI's folder batch
+    
+    Inputs below ``root`` keep their sub-folder inside ``out_dir``; a
+    ``tag`` is added to the name to tell apart inputs that share a stem.
+    """
+    name_without_ext = os.path.splitext(os.path.basename(input_path))[0]
+    if root is not None:
+        out_dir = os.path.join(out_dir, os.path.relpath(os.path.dirname(input_path), root))
+    return os.path.join(out_dir, f"{name_without_ext}{tag}_batch_outpainted{ext}")
+
+
+def common_root(paths):
+    """Deepest folder containing every path, or None"""
+    try:
+        return os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    except ValueError:
+        # No paths, or paths on different drives
+        return None
+
+
+def iter_jobs(args, manifest):
+    """Stream (input, output) pairs, skipping finished work on resume
+    
+    Listed inputs keep their layout below their common folder. Inputs
+    that would still share an output (img.png and img.jpg) get their
+    extension, then a counter, in the name; outputs are assigned before
+    the resume check so a resumed run names them the same way.
+    """
+    paths = iter_inputs(args.input, args.recursive)
+    root = args.input
+    if args.input == '-':
+        paths = list(paths)
+        root = common_root(paths)
+    ext = output_extension(args.format)
+    out_root = os.path.join(os.path.abspath(args.output), '')
+    seen = set()
+    targets = set()
+    for path in paths:
+        source = os.path.abspath(path)
+        # Never feed our own results back in when OUT_DIR is inside IN_DIR
+        if source.startswith(out_root) or source in seen:
+            continue
+        seen.add(source)
+        target = output_path(path, args.output, root, ext)
+        tag, n = "_" + os.path.splitext(path)[1].lstrip('.'), 1
+        while target in targets:
+            target = output_path(path, args.output, root, ext, tag if n == 1 else f"{tag}{n}")
+            n += 1
+        targets.add(target)
+        if args.resume and manifest.is_done(path):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        yield path, target
+
+
+def build_parser(settings):
+    """Argument parser with defaults taken from settings"""
+    parser = argparse.ArgumentParser(prog="python -m outpaint",
+                                     description="Headless image outpainting")
+    parser.add_argument('--config', help="config.json to read defaults from")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    batch = commands.add_parser('batch', help="outpaint every image of a folder or file list")
+    batch.add_argument('input', help="input folder, or '-' to read paths from stdin")
+    batch.add_argument('output', help="output folder")
+    batch.add_argument('--expansion', type=int, default=settings['last_expansion_size'])
+    batch.add_argument('--direction', choices=engine.DIRECTIONS, default=settings['last_direction'],
+                       help="sides to expand; with --aspect or --size the sides that may grow")
+    fit = batch.add_mutually_exclusive_group()
+    fit.add_argument('--margins', type=engine.parse_margins, metavar='T,B,L,R',
+                     help="per-side margins instead of --expansion")
+    fit.add_argument('--aspect', type=engine.parse_aspect, metavar='W:H',
+                     help="grow each image to this aspect ratio, e.g. 16:9")
+    fit.add_argument('--size', type=engine.parse_size, metavar='WxH',
+                     help="grow each image to this resolution, e.g. 1920x1080")
+    batch.add_argument('--method', choices=backend_names(), default=settings['last_method'])
+    batch.add_argument('--mode', choices=engine.MODES,
+                       default='band' if settings['band_mode'] else 'full')
+    batch.add_argument('--tile-size', type=int,
+                       default=engine.DEFAULT_TILE_SIZE if settings['tiled'] else 0,
+                       help="tile size for the tiled executor, 0 disables tiling")
+    batch.add_argument('--contrast', action='store_true', help="enhance contrast")
+    batch.add_argument('--sharpness', action='store_true', help="enhance sharpness")
+    batch.add_argument('--enhance-margins-only', action='store_true',
+                       default=settings['enhance_margins_only'],
+                       help="only enhance the outpainted area")
+    batch.add_argument('--blend', choices=BLEND_MODES, default=settings['blend'],
+                       help="smooth the seam between the original and the fill")
+    batch.add_argument('--blend-width', type=int, default=settings['blend_width'],
+                       help="width of the blended band in pixels (0: twice the inpaint radius)")
+    batch.add_argument('--workers', type=int, default=settings['batch_workers'] or None,
+                       help="pool workers (default: one per CPU)")
+    batch.add_argument('--executor', choices=tuning.EXECUTORS, default=settings['batch_executor'],
+                       help="run the workers as processes or as threads")
+    _add_policy_arguments(batch, settings)
+    batch.add_argument('-r', '--recursive', action='store_true', help="descend into sub-folders")
+    batch.add_argument('--manifest', help=f"job manifest (default: OUT_DIR/{MANIFEST_NAME})")
+    batch.add_argument('--resume', action='store_true',
+                       help="skip inputs the manifest records as finished")
+    batch.add_argument('--memory-budget-mb', type=int, default=settings['memory_budget_mb'],
+                       help="switch to tiled, memory-mapped processing above this estimate (0: off)")
+    batch.add_argument('--temp-dir', help="folder for memory-mapped intermediates")
+    batch.add_argument('--time-budget', type=float, default=settings['time_budget'],
+                       help="seconds per image for iterative methods such as patchmatch (0: no limit)")
+    batch.add_argument('--format', choices=tuple(OUTPUT_FORMATS), default=settings['output_format'],
+                       help="output image format")
+    batch.add_argument('--quality', type=int, default=settings['quality'],
+                       help="JPEG/WebP quality (0-100)")
+    batch.add_argument('--png-compression', type=int, default=settings['png_compression'],
+                       help="PNG compression level 0-9 (-1: OpenCV's fast default)")
+    batch.add_argument('--writers', type=int, default=DEFAULT_WRITERS,
+                       help="threads encoding and writing results")
+    batch.add_argument('--cache', metavar='DIR', help="reuse results from a result cache folder")
+    batch.add_argument('--cache-size-mb', type=int, default=settings['cache_size_mb'])
+    batch.add_argument('--metrics', metavar='FILE', help="write stage times and counters at the end")
+    batch.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json',
+                       help="format of --metrics (prometheus: text exposition format)")
+    batch.add_argument('--metrics-log', metavar='FILE',
+                       help="append one JSON line with stage times per image")
+    batch.add_argument('-q', '--quiet', action='store_true', help="only report failures")
+    
+    commands.add_parser('backends', help="list the available inpainting methods")
+    
+    serve_cmd = commands.add_parser('serve', help="run the local HTTP outpainting service")
+    serve_cmd.add_argument('--host', default=server.DEFAULT_HOST)
+    serve_cmd.add_argument('--port', type=int, default=server.DEFAULT_PORT)
+    serve_cmd.add_argument('--workers', type=int, default=settings['batch_workers'] or None,
+                           help="worker processes (default: one per CPU)")
+    _add_policy_arguments(serve_cmd, settings)
+    serve_cmd.add_argument('--queue-size', type=int, default=server.DEFAULT_QUEUE_SIZE,
+                           help="requests admitted before answering 429")
+    serve_cmd.add_argument('--coalesce', type=int, default=server.COALESCE_MAX,
+                           help="small requests processed together in one task (1: off)")
+    serve_cmd.add_argument('--max-body-mb', type=int, default=server.MAX_BODY_BYTES // (1024 * 1024))
+    
+    bench_cmd = commands.add_parser('bench', help="benchmark the hot paths on synthetic images")
+    bench_cmd.add_argument('--sizes', type=_float_list, default=bench.SIZES_MP,
+                           help="comma separated image sizes in megapixels")
+    bench_cmd.add_argument('--full', action='store_true',
+                           help=f"use the full size range {','.join(map(str, bench.FULL_SIZES_MP))} MP")
+    bench_cmd.add_argument('--expansions', type=_int_list, default=bench.EXPANSIONS)
+    bench_cmd.add_argument('--directions', type=_str_list, default=bench.DIRECTIONS)
+    bench_cmd.add_argument('--methods', type=_str_list, default=backend_names())
+    bench_cmd.add_argument('--paths', type=_str_list, default=bench.PATHS,
+                           help=f"engine paths to time: {', '.join(bench.PATH_OPTIONS)}")
+    bench_cmd.add_argument('--repeat', type=int, default=1, help="keep the best of N runs per case")
+    bench_cmd.add_argument('--quality', action='store_true',
+                           help="also score each method against a ground-truth texture")
+    bench_cmd.add_argument('--time-budget', type=float, default=bench.TIME_BUDGET,
+                           help="seconds per image for methods that take a time budget (0: no limit)")
+    bench_cmd.add_argument('--timeout', type=float, default=bench.DEFAULT_TIMEOUT,
+                           help="seconds before a case is abandoned")
+    bench_cmd.add_argument('--output', default='bench_results.json', help="JSON results file")
+    bench_cmd.add_argument('--compare', metavar='BASELINE', help="results of an earlier run to check against")
+    bench_cmd.add_argument('--threshold', type=float, default=bench.DEFAULT_THRESHOLD,
+                           help="allowed slowdown or RSS growth as a fraction of the baseline")
+    
+    tune_cmd = commands.add_parser('tune', help="calibrate batch workers and OpenCV threads "
+                                                "and store them in config.json")
+    tune_cmd.add_argument('--seconds', type=float, default=tuning.CALIBRATION_SECONDS,
+                          help="timed seconds per candidate")
+    tune_cmd.add_argument('--megapixels', type=float, default=tuning.CALIBRATION_MP,
+                          help="size of the synthetic calibration image")
+    tune_cmd.add_argument('--executors', type=_str_list, default=tuning.EXECUTORS,
+                          help="comma separated executors to try")
+    tune_cmd.add_argument('--affinity', choices=tuning.AFFINITY_MODES,
+                          default=settings['cpu_affinity'], help="CPU affinity used while timing")
+    tune_cmd.add_argument('--cpus', type=tuning.parse_cpus, metavar='LIST',
+                          help="CPUs to use, e.g. 0-7 (default: all available)")
+    tune_cmd.add_argument('--dry-run', action='store_true', help="report without saving")
+    return parser
+
+
+def _add_policy_arguments(parser, settings):
+    """OpenCV threads and CPU affinity options of a worker pool"""
+    parser.add_argument('--threads', type=int, default=settings['batch_threads'],
+                        help="OpenCV threads per worker (default: CPUs / workers, "
+                             "0: OpenCV's default)")
+    parser.add_argument('--affinity', choices=tuning.AFFINITY_MODES,
+                        default=settings['cpu_affinity'],
+                        help="pin: bind each worker to its own block of --threads CPUs")
+    parser.add_argument('--cpus', type=tuning.parse_cpus, metavar='LIST',
+                        help="CPUs the workers may use, e.g. 0-7 (default: all available)")
+
+
+def _policy(args):
+    """ThreadPolicy from the pool options, or None to leave the workers alone"""
+    if args.threads == 0 and args.affinity == "none":
+        return None
+    return tuning.ThreadPolicy(args.threads, args.affinity, args.cpus)
+
+
+def _str_list(value):
+    return tuple(item.strip() for item in value.split(',') if item.strip())
+
+
+def _int_list(value):
+    return tuple(int(item) for item in _str_list(value))
+
+
+def _float_list(value):
+    return tuple(float(item) for item in _str_list(value))
+
+
+def list_backends():
+    """Print the registered backends with their profiles"""
+    for backend in registered_backends():
+        print(f"{backend.name:<10} {backend.profile:<32} {backend.description}")
+    return EXIT_OK
+
+
+def run_batch(args):
+    """Run the batch subcommand and return an exit status"""
+    if args.input != '-' and not os.path.isdir(args.input):
+        print(f"error: input folder not found: {args.input}", file=sys.stderr)
+        return EXIT_USAGE
+    os.makedirs(args.output, exist_ok=True)
+    
+    params = {
+        'expansion': args.expansion,
+        'direction': args.direction,
+        'method': args.method,
+        'mode': args.mode,
+        'tile_size': args.tile_size or None,
+        'contrast': args.contrast,
+        'sharpness': args.sharpness,
+        'enhance_margins_only': args.enhance_margins_only,
+        'blend': args.blend,
+        'blend_width': args.blend_width or None,
+        'memory_budget': args.memory_budget_mb * 1024 * 1024 or None,
+        'temp_dir': args.temp_dir,
+        'backend_options': {'time_budget': args.time_budget or None}
+    }
+    for key, value in (('margins', args.margins), ('aspect', args.aspect), ('target_size', args.size)):
+        if value is not None:
+            params[key] = value
+    
+    def report(done, total, path, error):
+        if error is not None:
+            print(f"failed: {path}: {error}", file=sys.stderr)
+        elif not args.quiet:
+            print(f"[{done}] {path}", file=sys.stderr)
+    
+    manifest = Manifest(args.manifest or os.path.join(args.output, MANIFEST_NAME))
+    if args.resume:
+        manifest.load()
+    
+    cache = None
+    if args.cache:
+        cache = ResultCache(args.cache, args.cache_size_mb * 1024 * 1024)
+    
+    log = open(args.metrics_log, 'a') if args.metrics_log else None
+    metrics = Metrics(log)
+    writer = ImageWriter(args.quality, args.png_compression, max(1, args.writers))
+    try:
+        with manifest:
+            runner = BatchRunner(params, workers=args.workers, progress=report, manifest=manifest,
+                                 cache=cache, metrics=metrics, writer=writer,
+                                 executor=args.executor, policy=_policy(args))
+            result = runner.run(iter_jobs(args, manifest))
+    finally:
+        writer.close()
+        if log is not None:
+            log.close()
+    if args.metrics:
+        metrics.write(args.metrics, args.metrics_format)
+    
+    if not args.quiet:
+        print(f"processed {result.processed}, failed {len(result.failed)}", file=sys.stderr)
+        print(f"per image: {metrics.mean_timer().summary()}", file=sys.stderr)
+        if cache is not None:
+            stats = cache.stats()
+            print(f"cache hits {stats['hits']}, misses {stats['misses']}", file=sys.stderr)
+    return EXIT_FAILED if result.failed else EXIT_OK
+
+
+def run_serve(args, settings):
+    """Run the serve subcommand until interrupted"""
+    # Request parameters default to the GUI's last used values
+    defaults = {
+        'expansion': settings['last_expansion_size'],
+        'direction': settings['last_direction'],
+        'method': settings['last_method'],
+        'mode': 'band' if settings['band_mode'] else 'full',
+        'enhance_margins_only': settings['enhance_margins_only'],
+        'blend': settings['blend'],
+        'blend_width': settings['blend_width'] or None,
+        'backend_options': {'time_budget': settings['time_budget'] or None}
+    }
+    
+    def ready(host, port):
+        print(f"serving on http://{host}:{port}/outpaint", file=sys.stderr)
+    
+    server.serve(defaults, args.host, args.port, ready, workers=args.workers,
+                 queue_size=args.queue_size, coalesce=args.coalesce,
+                 max_body=args.max_body_mb * 1024 * 1024, policy=_policy(args))
+    return EXIT_OK
+
+
+def run_tune(args, settings, config_path=None):
+    """Run the tune subcommand and return an exit status"""
+    unknown = [e for e in args.executors if e not in tuning.EXECUTORS]
+    if unknown:
+        print(f"error: unknown executor: {', '.join(unknown)}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    # Calibrate with the GUI's last used parameters
+    params = {
+        'expansion': settings['last_expansion_size'],
+        'direction': settings['last_direction'],
+        'method': settings['last_method'],
+        'mode': 'band' if settings['band_mode'] else 'full',
+        'tile_size': engine.DEFAULT_TILE_SIZE if settings['tiled'] else None,
+        'backend_options': {'time_budget': settings['time_budget'] or None}
+    }
+    
+    def report(executor, workers, threads, rate):
+        print(f"{executor:<8} {workers:>3} workers x {threads:>3} threads {rate:8.2f} images/s",
+              file=sys.stderr)
+    
+    result = tuning.tune(params, args.megapixels, args.seconds, args.executors, args.affinity,
+                         args.cpus, report)
+    print(f"best: {result['executor']}, {result['workers']} workers x {result['threads']} threads "
+          f"({result['images_per_second']} images/s)", file=sys.stderr)
+    if args.dry_run:
+        return EXIT_OK
+    
+    path = config_path or settings_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    save_settings(tuning.apply_tuning(settings, result), path)
+    print(f"saved to {path}", file=sys.stderr)
+    return EXIT_OK
+
+
+def run_bench(args):
+    """Run the bench subcommand and return an exit status"""
+    unknown = [m for m in args.methods if m not in backend_names()]
+    bad_directions = [d for d in args.directions if d not in engine.DIRECTIONS]
+    bad_paths = [p for p in args.paths if p not in bench.PATH_OPTIONS]
+    if unknown or bad_directions or bad_paths:
+        print(f"error: unknown method, direction or path: "
+              f"{', '.join(unknown + bad_directions + bad_paths)}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    baseline = bench.load_results(args.compare) if args.compare else None
+    sizes = bench.FULL_SIZES_MP if args.full else args.sizes
+    cases = bench.build_cases(sizes, args.expansions, args.directions, args.methods, args.paths,
+                              args.time_budget or None)
+    if args.quality:
+        cases += bench.build_quality_cases(args.methods, time_budget=args.time_budget or None)
+    
+    def report(record):
+        if 'error' in record:
+            print(f"{record['id']:<40} failed: {record['error']}", file=sys.stderr)
+        elif 'mae' in record:
+            print(f"{record['id']:<40} {record['total']:9.3f}s {record['mp_per_s']:8.2f} MP/s "
+                  f"MAE {record['mae']:6.2f} gradient {record['gradient']:.2f} "
+                  f"(texture {record['truth_gradient']:.2f})", file=sys.stderr)
+        else:
+            rss = record['peak_rss_mb']
+            print(f"{record['id']:<40} {record['total']:9.3f}s {record['mp_per_s']:8.2f} MP/s "
+                  f"{rss if rss is not None else '-':>8} MB", file=sys.stderr)
+    
+    results = bench.run_benchmarks(cases, args.repeat, args.timeout, report)
+    bench.save_results(results, args.output)
+    
+    if baseline is None:
+        return EXIT_OK
+    regressions = bench.compare(results, baseline, args.threshold)
+    for case, metric, old, new in regressions:
+        print(f"regression: {case} {metric} {old} -> {new}", file=sys.stderr)
+    return EXIT_FAILED if regressions else EXIT_OK
+
+
+def main(argv=None):
+    """Parse arguments and dispatch to a subcommand"""
+    argv = sys.argv[1:] if argv is None else argv
+    
+    # --config has to be known before the defaults are built
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument('--config')
+    known, _ = pre.parse_known_args(argv)
+    
+    settings = load_settings(known.config)
+    args = build_parser(settings).parse_args(argv)
+    if args.command == 'batch':
+        return run_batch(args)
+    if args.command == 'backends':
+        return list_backends()
+    if args.command == 'bench':
+        return run_bench(args)
+    if args.command == 'serve':
+        return run_serve(args, settings)
+    if args.command == 'tune':
+        return run_tune(args, settings, known.config)
+    return EXIT_USAGE
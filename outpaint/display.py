@@ -0,0 +1,73 @@
+"""Scaled frames for the image canvases.
+
+Images are scaled to the canvas before anything else touches them, so
+the colour conversion and the toolkit image only ever see canvas-sized
+pixels. FrameCache keeps the finished frames per image and canvas size;
+redrawing an image that is already cached costs a dictionary lookup.
+"""
+from collections import OrderedDict
+
+import cv2
+
+# Free space kept around an image inside its canvas
+DISPLAY_MARGIN = 20
+
+# Canvas size assumed before the window is laid out
+FALLBACK_SIZE = (300, 200)
+
+# Frames kept per cache; two canvases at a few sizes each
+MAX_FRAMES = 8
+
+
+def fit_size(shape, canvas_size, margin=DISPLAY_MARGIN):
+    """Size (w, h) an image of ``shape`` is shown at in a canvas"""
+    h, w = shape[:2]
+    canvas_width, canvas_height = canvas_size
+    scale = min((canvas_width - margin) / w, (canvas_height - margin) / h)
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+def display_frame(image, size):
+    """BGR image scaled to ``size`` and converted to RGB"""
+    h, w = image.shape[:2]
+    if (w, h) != size:
+        interpolation = cv2.INTER_AREA if size[0] < w else cv2.INTER_LINEAR
+        image = cv2.resize(image, size, interpolation=interpolation)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+class FrameCache:
+    """LRU cache of rendered frames keyed by (image, canvas size)
+
+    ``render(rgb)`` turns a scaled RGB frame into whatever the caller
+    draws, e.g. an ImageTk.PhotoImage. Entries hold a reference to their
+    image, so an id() is never reused while its frames are cached.
+    """
+
+    def __init__(self, render, max_frames=MAX_FRAMES):
+        self.render = render
+        self.max_frames = max_frames
+        self._frames = OrderedDict()
+
+    def get(self, image, canvas_size, margin=DISPLAY_MARGIN):
+        """Rendered frame of ``image`` fitted into ``canvas_size``"""
+        size = fit_size(image.shape, canvas_size, margin)
+        key = (id(image), size)
+        entry = self._frames.get(key)
+        if entry is not None and entry[0] is image:
+            self._frames.move_to_end(key)
+            return entry[1]
+
+        frame = self.render(display_frame(image, size))
+        self._frames[key] = (image, frame)
+        while len(self._frames) > self.max_frames:
+            self._frames.popitem(last=False)
+        return frame
+
+    def discard(self, image):
+        """Drop every frame of an image"""
+        for key in [key for key, entry in self._frames.items() if entry[0] is image]:
+            del self._frames[key]
+
+    def clear(self):
+        self._frames.clear()
@@ -0,0 +1,439 @@
+"""Headless outpainting engine.
+
+Pure functions over BGR uint8 NumPy arrays with no Tk dependency, shared by
+the GUI, the batch paths and any server or worker process.
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .backends import backend_names, get_backend
+from .blend import blend_seam, default_blend_width
+from .enhance import enhance_native
+from .geometry import canvas_geometry
+from .metrics import stage
+
+DIRECTIONS = ("all", "left", "right", "top", "bottom", "horizontal", "vertical")
+METHODS = backend_names()
+MODES = ("full", "band")
+
+# outpaint() parameters that decide the margins
+MARGIN_PARAMS = ("expansion", "direction", "margins", "aspect", "target_size")
+
+# Tiled executor defaults
+DEFAULT_TILE_SIZE = 512
+
+
+def expansion_margins(expansion_size, direction):
+    """Return (top, bottom, left, right) margins for a direction preset"""
+    e = expansion_size
+    if direction == "all":
+        return e, e, e, e
+    elif direction == "horizontal":
+        return 0, 0, e, e
+    elif direction == "vertical":
+        return e, e, 0, 0
+    elif direction == "left":
+        return 0, 0, e, 0
+    elif direction == "right":
+        return 0, 0, 0, e
+    elif direction == "top":
+        return e, 0, 0, 0
+    elif direction == "bottom":
+        return 0, e, 0, 0
+    raise ValueError(f"Unknown direction: {direction!r}")
+
+
+def _split(extra, first, second):
+    """Share ``extra`` pixels between the growing sides of an axis"""
+    if first and second:
+        return extra // 2, extra - extra // 2
+    return extra * first, extra * second
+
+
+def fit_margins(shape, width, height, direction="all"):
+    """Margins that grow an image of ``shape`` to exactly width x height
+    
+    ``direction`` picks the sides that may grow: both sides of an axis
+    share the extra pixels evenly, a single side takes all of them.
+    """
+    h, w = shape[:2]
+    if width < w or height < h:
+        raise ValueError(f"Target size {width}x{height} is smaller than the image ({w}x{h})")
+    
+    top, bottom, left, right = expansion_margins(1, direction)
+    if (height > h and not (top or bottom)) or (width > w and not (left or right)):
+        raise ValueError(f"Direction {direction!r} cannot reach {width}x{height} from {w}x{h}")
+    return _split(height - h, top, bottom) + _split(width - w, left, right)
+
+
+def aspect_margins(shape, aspect, direction="all"):
+    """Smallest margins that give an image of ``shape`` the aspect ratio width / height"""
+    if aspect <= 0:
+        raise ValueError(f"Aspect ratio must be positive: {aspect!r}")
+    h, w = shape[:2]
+    if w / h < aspect:
+        return fit_margins(shape, max(w, round(h * aspect)), h, direction)
+    return fit_margins(shape, w, max(h, round(w / aspect)), direction)
+
+
+def outpaint_margins(shape, expansion=None, direction="all", margins=None, aspect=None,
+                     target_size=None):
+    """Return (top, bottom, left, right) margins for an input of ``shape``
+    
+    Explicit per-side ``margins`` win over a ``target_size`` (width,
+    height), which wins over an ``aspect`` ratio, which wins over the
+    ``expansion`` preset. The fit modes grow the sides ``direction``
+    allows.
+    """
+    if margins is not None:
+        margins = tuple(int(m) for m in margins)
+        if len(margins) != 4 or min(margins) < 0:
+            raise ValueError(f"Margins must be four sizes (top, bottom, left, right): {margins!r}")
+        return margins
+    if target_size is not None:
+        return fit_margins(shape, *target_size, direction)
+    if aspect is not None:
+        return aspect_margins(shape, aspect, direction)
+    if expansion is None:
+        raise ValueError("No expansion, margins, aspect ratio or target size given")
+    return expansion_margins(expansion, direction)
+
+
+def margin_params(params):
+    """The entries of an outpaint() parameter dict that decide the margins"""
+    return {key: params[key] for key in MARGIN_PARAMS if key in params}
+
+
+def output_shape(shape, expansion=None, direction="all", margins=None, aspect=None,
+                 target_size=None):
+    """Shape of the outpainted result for an input of ``shape``"""
+    top, bottom, left, right = outpaint_margins(shape, expansion, direction, margins, aspect,
+                                                target_size)
+    return (shape[0] + top + bottom, shape[1] + left + right) + tuple(shape[2:])
+
+
+def parse_aspect(text):
+    """Aspect ratio width / height from '16:9', '16/9' or '1.78'"""
+    for sep in (':', '/'):
+        if sep in text:
+            width, height = (float(v) for v in text.split(sep, 1))
+            break
+    else:
+        width, height = float(text), 1.0
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Aspect ratio must be positive: {text!r}")
+    return width / height
+
+
+def parse_size(text):
+    """(width, height) from '1920x1080'"""
+    width, height = (int(v) for v in text.lower().split('x', 1))
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Target size must be positive: {text!r}")
+    return width, height
+
+
+def parse_margins(text):
+    """(top, bottom, left, right) from 'top,bottom,left,right'"""
+    margins = tuple(int(m) for m in text.split(','))
+    if len(margins) != 4 or min(margins) < 0:
+        raise ValueError(f"Expected four comma-separated margins: {text!r}")
+    return margins
+
+
+def parse_fit(text):
+    """Margin parameters from one text field
+    
+    'WxH' is a target size, 'W:H' or 'W/H' an aspect ratio and
+    'top,bottom,left,right' explicit margins; an empty field keeps the
+    expansion preset.
+    """
+    text = text.strip().lower()
+    try:
+        if not text or text == "expansion":
+            return {}
+        if ',' in text:
+            return {'margins': parse_margins(text)}
+        if 'x' in text:
+            return {'target_size': parse_size(text)}
+        return {'aspect': parse_aspect(text)}
+    except ValueError:
+        raise ValueError(f"Cannot read fit {text!r}; use WxH, W:H or top,bottom,left,right") from None
+
+
+def inpaint_radius(expansion_size):
+    """Inpaint radius used for a given expansion size"""
+    return max(3, expansion_size // 10)
+
+
+def band_width(radius):
+    """Width of the seam band solved by the inpainter in band mode"""
+    return 2 * radius
+
+
+def create_outpainting_mask(image, expansion_size, direction):
+    """Build the expanded canvas and its mask (255 = area to inpaint)"""
+    return expand_canvas(image, *expansion_margins(expansion_size, direction))
+
+
+def expand_canvas(image, top, bottom, left, right, builder=None):
+    """Build a canvas with explicit per-side margins and its mask
+    
+    With a CanvasBuilder the canvas is a view into its reusable buffers.
+    The mask (white = area to inpaint, black = known area) is the shared,
+    read-only mask of the geometry cache.
+    """
+    if builder is not None:
+        return builder.build(image, top, bottom, left, right)
+    
+    geometry = canvas_geometry(image.shape, (top, bottom, left, right))
+    y0, y1, x0, x1 = geometry.known_box
+    
+    # Create expanded canvas with the original placed at its offset
+    expanded_image = np.zeros(geometry.canvas_shape + (3,), dtype=np.uint8)
+    expanded_image[y0:y1, x0:x1] = image
+    
+    return expanded_image, geometry.mask
+
+
+def _fill_margins(array, margins, value):
+    """Set the margin area of a canvas-shaped array in place"""
+    top, bottom, left, right = margins
+    h, w = array.shape[:2]
+    array[:top] = value
+    array[h - bottom:] = value
+    array[top:h - bottom, :left] = value
+    array[top:h - bottom, w - right:] = value
+
+
+class CanvasBuilder:
+    """Reusable canvas buffer for batches of similar images
+    
+    The buffer only grows, so a run of same-sized images allocates once;
+    the mask comes read-only from the geometry cache. The canvas returned
+    by build() is overwritten by the next call.
+    """
+    
+    def __init__(self):
+        self._canvas = np.empty(0, dtype=np.uint8)
+    
+    def _buffer(self, name, shape):
+        size = int(np.prod(shape))
+        buffer = getattr(self, name)
+        if buffer.size < size:
+            buffer = np.empty(size, dtype=np.uint8)
+            setattr(self, name, buffer)
+        return buffer[:size].reshape(shape)
+    
+    def build(self, image, top, bottom, left, right):
+        """Fill the canvas buffer for an image and return (canvas, mask)"""
+        margins = (top, bottom, left, right)
+        geometry = canvas_geometry(image.shape, margins)
+        
+        canvas = self._buffer('_canvas', geometry.canvas_shape + (3,))
+        y0, y1, x0, x1 = geometry.known_box
+        _fill_margins(canvas, margins, 0)
+        canvas[y0:y1, x0:x1] = image
+        return canvas, geometry.mask
+    
+    def release(self):
+        """Drop the buffer"""
+        self._canvas = np.empty(0, dtype=np.uint8)
+
+
+_thread_state = threading.local()
+
+
+def thread_builder():
+    """CanvasBuilder private to the calling thread"""
+    builder = getattr(_thread_state, 'builder', None)
+    if builder is None:
+        builder = _thread_state.builder = CanvasBuilder()
+    return builder
+
+
+def enhance_image(image, contrast=False, sharpness=False, margins=None):
+    """Apply optional contrast and sharpness enhancement
+    
+    ``margins`` (top, bottom, left, right) restricts it to the outpainted area.
+    """
+    return enhance_native(image, contrast, sharpness, margins)
+
+
+def solve(expanded_image, mask, radius, method, options=None):
+    """Fill the masked area of a canvas with a registered backend
+    
+    ``options`` are passed on to backends that accept them.
+    """
+    return get_backend(method)(expanded_image, mask, radius, **(options or {}))
+
+
+def inpaint_tiled(expanded_image, mask, margins, radius, method,
+                  tile_size=DEFAULT_TILE_SIZE, workers=None, inplace=False, options=None):
+    """Inpaint each margin as overlapping tiles on a thread pool
+    
+    Every tile is solved on a crop that reaches ``2 * radius`` pixels of
+    context into its neighbours, and at most two tiles per worker are in
+    flight, so peak memory follows the tile size rather than the canvas.
+    Tiles are written back in order, cross-fading each one linearly into
+    the previous tile over their overlap. OpenCV releases the GIL, so
+    threads run the tiles concurrently. With ``inplace`` the given canvas
+    and mask (which may be memory-mapped) are updated directly.
+    """
+    h, w = mask.shape[:2]
+    workers = workers or os.cpu_count() or 1
+    context = 2 * radius
+    overlap = min(max(8, 2 * radius), tile_size // 2)
+    ramp = np.linspace(0, 1, overlap + 2, dtype=np.float32)[1:-1]
+    result = expanded_image if inplace else expanded_image.copy()
+    mask = mask if inplace else mask.copy()
+    top, bottom, left, right = margins
+    geometry = canvas_geometry((h - top - bottom, w - left - right), margins)
+    
+    def solve_tile(y0, y1, x0, x1):
+        # Masked pixels are ignored by the solvers, so tiles written back
+        # by other threads do not change this tile's result
+        cy0, cy1 = max(0, y0 - context), min(h, y1 + context)
+        cx0, cx1 = max(0, x0 - context), min(w, x1 + context)
+        filled = solve(result[cy0:cy1, cx0:cx1], mask[cy0:cy1, cx0:cx1], radius, method, options)
+        return filled[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+    
+    def write_tile(axis, blend, box, pixels):
+        y0, y1, x0, x1 = box
+        n = min(overlap, pixels.shape[axis]) if blend else 0
+        if axis == 0:
+            seam, core = result[y0:y0 + n, x0:x1], result[y0 + n:y1, x0:x1]
+            new_seam, new_core = pixels[:n], pixels[n:]
+            weights = ramp[:n, None, None]
+        else:
+            seam, core = result[y0:y1, x0:x0 + n], result[y0:y1, x0 + n:x1]
+            new_seam, new_core = pixels[:, :n], pixels[:, n:]
+            weights = ramp[None, :n, None]
+        if n:
+            seam[...] = (seam * (1 - weights) + new_seam * weights + 0.5).astype(np.uint8)
+        core[...] = new_core
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for phase_strips, tiles in geometry.tile_plan(tile_size, overlap):
+            # Bounded window of tiles in flight, written back in order
+            in_flight = deque()
+            for axis, blend, box in tiles:
+                in_flight.append((axis, blend, box, pool.submit(solve_tile, *box)))
+                if len(in_flight) >= 2 * workers:
+                    axis, blend, box, future = in_flight.popleft()
+                    write_tile(axis, blend, box, future.result())
+            while in_flight:
+                axis, blend, box, future = in_flight.popleft()
+                write_tile(axis, blend, box, future.result())
+            
+            # Solved strips become known context for the next phase
+            for _, _, y0, y1, x0, x1 in phase_strips:
+                mask[y0:y1, x0:x1] = 0
+    
+    return result
+
+
+def fill_canvas(expanded_image, mask, margins, radius, method, tile_size=None, workers=None,
+                options=None):
+    """Solve a canvas either in one call or with the tiled executor
+    
+    Backends that do not support tiles are always solved in one call.
+    """
+    if tile_size and get_backend(method).tiles:
+        return inpaint_tiled(expanded_image, mask, margins, radius, method, tile_size, workers,
+                             options=options)
+    return solve(expanded_image, mask, radius, method, options)
+
+
+def band_margins(margins, radius, width=None):
+    """Split margins into the inpainted band and the replicated rest"""
+    if width is None:
+        width = band_width(radius)
+    inner = tuple(min(m, width) for m in margins)
+    rest = tuple(m - i for m, i in zip(margins, inner))
+    return inner, rest
+
+
+def inpaint_band(image, margins, radius, method, width=None, tile_size=None, workers=None,
+                 builder=None, options=None, timer=None):
+    """Inpaint only a strip near the seam and replicate it outwards
+    
+    The inpainter runs on the original plus at most ``width`` pixels of
+    each margin; the remaining margin is filled by edge replication of
+    the solved band, so the cost scales with the border length instead
+    of the margin area.
+    """
+    inner, rest = band_margins(margins, radius, width)
+    
+    with stage(timer, "mask"):
+        expanded_image, mask = expand_canvas(image, *inner, builder=builder)
+    
+    with stage(timer, "inpaint"):
+        result = fill_canvas(expanded_image, mask, inner, radius, method, tile_size, workers, options)
+        if any(rest):
+            top, bottom, left, right = rest
+            result = cv2.copyMakeBorder(result, top, bottom, left, right, cv2.BORDER_REPLICATE)
+    return result
+
+
+def outpaint(image, expansion=None, direction="all", method="telea", radius=None,
+             contrast=False, sharpness=False, mode="full", tile_size=None, workers=None,
+             builder=None, memory_budget=None, temp_dir=None, enhance_margins_only=False,
+             backend_options=None, blend=None, blend_width=None, margins=None, aspect=None,
+             target_size=None, timer=None):
+    """Outpaint a BGR image and return the expanded, filled result
+    
+    The margins come from ``expansion`` and ``direction``, or from
+    per-side ``margins``, an ``aspect`` ratio or a ``target_size`` (see
+    outpaint_margins()), and are filled in a single pass.
+    ``tile_size`` switches to the tiled executor with ``workers`` threads;
+    a CanvasBuilder lets repeated calls reuse the canvas and mask buffers.
+    When the estimated peak memory exceeds ``memory_budget`` bytes the
+    image is processed tile by tile on memory-mapped files in ``temp_dir``.
+    ``enhance_margins_only`` leaves the original pixels unenhanced.
+    ``backend_options`` (e.g. a PatchMatch ``time_budget``) go to the fill
+    backend when it accepts them. ``blend`` ('feather' or 'poisson')
+    smooths the seam within ``blend_width`` pixels of the original. A
+    metrics.StageTimer passed as ``timer`` receives the mask, inpaint,
+    blend and enhance times.
+    """
+    if image is None:
+        raise ValueError("No image given")
+    
+    margins = outpaint_margins(image.shape, expansion, direction, margins, aspect, target_size)
+    if radius is None:
+        radius = inpaint_radius(max(margins))
+    
+    if memory_budget:
+        from .memory import estimate_peak_bytes, outpaint_budgeted
+        if estimate_peak_bytes(image.shape, margins, radius, mode, contrast or sharpness,
+                               method) > memory_budget:
+            return outpaint_budgeted(image, margins, radius, method, mode, contrast, sharpness,
+                                     memory_budget, temp_dir, workers, enhance_margins_only,
+                                     backend_options, timer, blend, blend_width)
+    
+    if mode == "full":
+        with stage(timer, "mask"):
+            expanded_image, mask = expand_canvas(image, *margins, builder=builder)
+        with stage(timer, "inpaint"):
+            result = fill_canvas(expanded_image, mask, margins, radius, method, tile_size, workers,
+                                 backend_options)
+    elif mode == "band":
+        result = inpaint_band(image, margins, radius, method, tile_size=tile_size, workers=workers,
+                              builder=builder, options=backend_options, timer=timer)
+    else:
+        raise ValueError(f"Unknown fill mode: {mode!r}")
+    
+    if blend not in (None, "none"):
+        with stage(timer, "blend"):
+            blend_seam(result, margins, blend, blend_width or default_blend_width(radius))
+    
+    # The result is a fresh array, so enhance it in place
+    with stage(timer, "enhance"):
+        return enhance_native(result, contrast, sharpness,
+                              margins if enhance_margins_only else None, inplace=True)
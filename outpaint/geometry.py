@@ -0,0 +1,273 @@
+"""Cached canvas geometry.
+
+Everything about an outpainting canvas that depends only on the input
+size and the margins (the mask, the offset of the original, margin
+strips, tile plans and the seam band used for blending) is computed once
+per (h, w, margins) and shared. Margins are a function of (expansion,
+direction), so a batch of same-size images does its setup work once.
+
+Cached arrays are read-only; code that needs to change a mask works on
+a copy. The cache is bounded by entries and by the bytes of the masks
+and seam bands it holds, so every process that sees mixed sizes keeps
+at most ``DEFAULT_MAX_BYTES`` of geometry.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Geometries kept, and the bytes of masks and seam bands they may hold
+DEFAULT_MAX_ENTRIES = 32
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Masks larger than this are built per call instead of being cached
+MAX_CACHED_MASK_PIXELS = 16 * 1024 * 1024
+
+# Seam band widths kept per geometry, the oldest dropped first, and the
+# size above which a band is built per call instead of being cached
+MAX_BANDS = 4
+MAX_CACHED_BAND_BYTES = 64 * 1024 * 1024
+
+
+def tile_spans(start, stop, tile_size, overlap):
+    """Split [start, stop) into overlapping (begin, end) spans"""
+    spans = []
+    step = max(1, tile_size - overlap)
+    begin = start
+    while True:
+        end = min(begin + tile_size, stop)
+        spans.append((begin, end))
+        if end >= stop:
+            return spans
+        begin += step
+
+
+def margin_strips(shape, margins):
+    """Margin strips as (phase, axis, y0, y1, x0, x1)
+
+    Top and bottom strips cover the original's columns and are solved
+    first; the left and right strips span the full height, so corners are
+    filled with the already solved top and bottom strips as context.
+    """
+    h, w = shape[:2]
+    top, bottom, left, right = margins
+    strips = []
+    if top:
+        strips.append((0, 1, 0, top, left, w - right))
+    if bottom:
+        strips.append((0, 1, h - bottom, h, left, w - right))
+    if left:
+        strips.append((1, 0, 0, h, 0, left))
+    if right:
+        strips.append((1, 0, 0, h, w - right, w))
+    return strips
+
+
+class SeamBand:
+    """Unknown pixels near the known rectangle, as flat canvas indices
+
+    ``pixels`` are the unknown pixels within the band, ``nearest`` their
+    nearest known pixels, ``ring`` the unknown pixels next to those, on
+    the way to the band pixel, and ``distance`` the Euclidean distance to
+    the known rectangle. The arrays are read-only.
+    """
+
+    def __init__(self, pixels, nearest, ring, distance):
+        self.pixels = pixels
+        self.nearest = nearest
+        self.ring = ring
+        self.distance = distance
+        for array in (pixels, nearest, ring, distance):
+            array.setflags(write=False)
+
+    def __len__(self):
+        return self.pixels.size
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.pixels, self.nearest, self.ring, self.distance))
+
+
+def seam_band(canvas_shape, box, width):
+    """SeamBand of the pixels within ``width`` of a known box (y0, y1, x0, x1)
+
+    The distance transform of a rectangle has a closed form, so only the
+    band pixels are visited: candidates come from the four edge strips
+    and four corner boxes around the box, each at most ``width`` deep,
+    and never from its interior.
+    """
+    h, w = canvas_shape[:2]
+    y0, y1, x0, x1 = box
+
+    # Candidates: the rectangle grown by ``width`` minus the rectangle
+    rows = ((max(0, y0 - width), y0), (y0, y1), (y1, min(h, y1 + width)))
+    cols = ((max(0, x0 - width), x0), (x0, x1), (x1, min(w, x1 + width)))
+    parts = []
+    for i, (ry0, ry1) in enumerate(rows):
+        for j, (rx0, rx1) in enumerate(cols):
+            if (i, j) != (1, 1) and ry1 > ry0 and rx1 > rx0:
+                parts.append([a.ravel() for a in np.mgrid[ry0:ry1, rx0:rx1]])
+    if not parts:
+        empty = np.empty(0, dtype=np.int64)
+        return SeamBand(empty, empty.copy(), empty.copy(), np.empty(0, dtype=np.float32))
+    ys = np.concatenate([part[0] for part in parts])
+    xs = np.concatenate([part[1] for part in parts])
+
+    # Nearest known pixel of a rectangle: clamp into it
+    qy, qx = np.clip(ys, y0, y1 - 1), np.clip(xs, x0, x1 - 1)
+    dy, dx = ys - qy, xs - qx
+    distance = np.sqrt(dy * dy + dx * dx).astype(np.float32)
+    inside = distance <= width
+    ys, xs, qy, qx, dy, dx, distance = (a[inside] for a in (ys, xs, qy, qx, dy, dx, distance))
+
+    ry = qy + np.rint(dy / distance).astype(ys.dtype)
+    rx = qx + np.rint(dx / distance).astype(xs.dtype)
+    return SeamBand(ys * w + xs, qy * w + qx, ry * w + rx, distance)
+
+
+class CanvasGeometry:
+    """Layout of the canvas for an (h, w) input and (top, bottom, left, right) margins
+
+    Derived structures are built on first use and kept; everything
+    returned is shared and must not be modified.
+    """
+
+    def __init__(self, shape, margins):
+        self.shape = tuple(shape[:2])
+        self.margins = tuple(int(m) for m in margins)
+        h, w = self.shape
+        top, bottom, left, right = self.margins
+        self.canvas_shape = (h + top + bottom, w + left + right)
+        self.offset = (top, left)
+        self.known_box = (top, top + h, left, left + w)
+        self._lock = threading.Lock()
+        self._mask = None
+        self._derived = {}
+
+    @property
+    def mask(self):
+        """Canvas mask, 255 in the margins and 0 over the original"""
+        if self._mask is None:
+            mask = np.full(self.canvas_shape, 255, dtype=np.uint8)
+            y0, y1, x0, x1 = self.known_box
+            mask[y0:y1, x0:x1] = 0
+            mask.setflags(write=False)
+            if mask.size > MAX_CACHED_MASK_PIXELS:
+                return mask
+            self._mask = mask
+        return self._mask
+
+    def _get(self, key, build):
+        with self._lock:
+            value = self._derived.get(key)
+        if value is None:
+            value = build()
+            with self._lock:
+                value = self._derived.setdefault(key, value)
+        return value
+
+    def strips(self):
+        """margin_strips of the canvas"""
+        return self._get(('strips',), lambda: margin_strips(self.canvas_shape, self.margins))
+
+    def tile_plan(self, tile_size, overlap):
+        """Tiles of the tiled executor per phase, as (axis, blend, box) lists"""
+        def build():
+            phases = []
+            for phase in (0, 1):
+                strips = [strip for strip in self.strips()
+                          if strip[0] == phase and strip[3] > strip[2] and strip[5] > strip[4]]
+                tiles = []
+                for _, axis, y0, y1, x0, x1 in strips:
+                    start, stop = (y0, y1) if axis == 0 else (x0, x1)
+                    for begin, end in tile_spans(start, stop, tile_size, overlap):
+                        box = (begin, end, x0, x1) if axis == 0 else (y0, y1, begin, end)
+                        tiles.append((axis, begin > start, box))
+                phases.append((strips, tiles))
+            return phases
+        return self._get(('tiles', tile_size, overlap), build)
+
+    def seam_band(self, width):
+        """SeamBand of the unknown pixels within ``width`` of the original"""
+        key = ('band', width)
+        with self._lock:
+            band = self._derived.get(key)
+        if band is not None:
+            return band
+        band = seam_band(self.canvas_shape, self.known_box, width)
+        if band.nbytes > MAX_CACHED_BAND_BYTES:
+            return band
+        with self._lock:
+            band = self._derived.setdefault(key, band)
+            widths = [key for key in self._derived if key[0] == 'band']
+            for key in widths[:-MAX_BANDS]:
+                del self._derived[key]
+        return band
+
+    @property
+    def nbytes(self):
+        """Bytes held by the cached mask and seam bands"""
+        with self._lock:
+            bands = [value for key, value in self._derived.items() if key[0] == 'band']
+        mask = self._mask
+        return (mask.nbytes if mask is not None else 0) + sum(band.nbytes for band in bands)
+
+    def __repr__(self):
+        return f"CanvasGeometry(shape={self.shape}, margins={self.margins})"
+
+
+class GeometryCache:
+    """Bounded LRU cache of CanvasGeometry objects, safe to share between threads
+
+    Geometries fill in their mask and bands after they are handed out, so
+    the byte bound is enforced on every lookup; the geometry returned is
+    never evicted by its own lookup.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, shape, margins):
+        key = (int(shape[0]), int(shape[1]), tuple(int(m) for m in margins))
+        with self._lock:
+            geometry = self._entries.get(key)
+            if geometry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                geometry = self._entries[key] = CanvasGeometry(key[:2], key[2])
+            self._evict()
+            return geometry
+
+    def _evict(self):
+        """Drop least recently used geometries beyond the bounds, keeping the newest"""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        total = sum(geometry.nbytes for geometry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, geometry = self._entries.popitem(last=False)
+            total -= geometry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'bytes': sum(geometry.nbytes for geometry in self._entries.values())}
+
+
+_cache = GeometryCache()
+
+
+def canvas_geometry(shape, margins):
+    """Shared CanvasGeometry for an input of ``shape`` and margins"""
+    return _cache.get(shape, margins)
+
@@ -0,0 +1,333 @@
+"""Cancellable outpainting jobs.
+
+Jobs line up in a JobQueue and run one at a time in a persistent child
+process (a ChildWorker), so a long cv2.inpaint call can be aborted by
+terminating the process instead of waiting for it to return; the next
+job starts a new one. Images travel to and from the child in shared
+memory (see shared.py); the queue keeps the current input shared, so
+repeated jobs on one image do not copy it again.
+"""
+import itertools
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from . import engine
+from .cache import cache_key
+from .metrics import StageTimer
+from .shared import SharedArray, can_share
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# How often the runner checks the cancellation token while a child works
+POLL_INTERVAL = 0.05
+
+_ids = itertools.count(1)
+
+
+class Job:
+    """One outpainting request with its state, timings and cancel token"""
+
+    def __init__(self, image, params, meta=None):
+        self.id = next(_ids)
+        self.image = image
+        self.params = dict(params)
+        self.meta = meta or {}
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.timer = StageTimer()
+        self.cancel_token = threading.Event()
+
+    def cancel(self):
+        """Request cancellation; a running child process is terminated"""
+        self.cancel_token.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.is_set()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def duration(self):
+        """Seconds spent running, or None if the job never started"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def __repr__(self):
+        return f"Job(id={self.id}, state={self.state!r})"
+
+
+def _outpaint_request(image, params, target=None):
+    """Outpaint one request in the worker; returns (result, stage times, error)
+
+    With a ``target`` handle, ``image`` is a handle too and the result is
+    written into the target block instead of being sent.
+    """
+    blocks = []
+    try:
+        if target is not None:
+            blocks = [SharedArray.attach(image), SharedArray.attach(target)]
+            image = blocks[0].array
+        timer = StageTimer()
+        result = engine.outpaint(image, timer=timer, **params)
+        if target is not None:
+            blocks[1].array[...] = result
+            result = None
+        return result, timer.times, None
+    except Exception as e:
+        return None, {}, f"{type(e).__name__}: {e}"
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def _worker_loop(conn):
+    """Worker process entry point: answer requests until told to stop"""
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            if request is None:
+                return
+            conn.send(_outpaint_request(*request))
+    finally:
+        conn.close()
+
+
+class ChildWorker:
+    """Persistent worker process that outpaints one request at a time
+
+    The process is spawned on first use and then reused, so requests do
+    not pay for a new interpreter and the numpy, OpenCV and engine
+    imports. Cancelling terminates it; the next request spawns a new one.
+    """
+
+    def __init__(self):
+        self._process = None
+        self._conn = None
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def _start(self):
+        # A forked child would inherit the GUI's Tk, OpenCV and runner threads
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(target=_worker_loop, args=(child_conn,), daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def _kill(self):
+        """Terminate the process; the next request starts a fresh one"""
+        if self._process is None:
+            return
+        self._process.terminate()
+        self._process.join()
+        self._conn.close()
+        self._process = self._conn = None
+
+    def run(self, image, params, cancel_token, timer=None):
+        """Outpaint in the worker; returns None if cancelled
+
+        ``image`` is an array or a SharedArray. The result comes back in a
+        shared block when there is room for one, and through the pipe
+        otherwise. The worker's stage times are added to ``timer`` when
+        one is given.
+        """
+        source = image if isinstance(image, SharedArray) else None
+        shape = engine.output_shape(image.shape, **engine.margin_params(params))
+        target = None
+        if can_share(int(np.prod(shape)) + (0 if source is not None else image.nbytes)):
+            if source is None:
+                source = SharedArray.copy_of(image)
+            target = SharedArray.create(shape, np.uint8)
+            request = (source.handle, params, target.handle)
+        else:
+            request = (source.array if source is not None else image, params)
+
+        try:
+            if not self.alive:
+                self._kill()
+                self._start()
+            try:
+                self._conn.send(request)
+                while not self._conn.poll(POLL_INTERVAL):
+                    if cancel_token.is_set():
+                        self._kill()
+                        return None
+                    if not self._process.is_alive() and not self._conn.poll():
+                        raise EOFError
+                result, times, error = self._conn.recv()
+            except (EOFError, OSError):
+                # The worker died mid-request; start over on the next one
+                code = self._process.exitcode
+                self._kill()
+                raise RuntimeError(f"Worker process exited with code {code}") from None
+            if timer is not None:
+                timer.update(times)
+            if error is not None:
+                raise RuntimeError(error)
+            # The result array keeps the block mapped after close()
+            return target.array if target is not None else result
+        finally:
+            if source is not None and source is not image:
+                source.close()
+            if target is not None:
+                target.close()
+
+    def close(self):
+        """Ask the worker to exit, terminating it if it does not"""
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(POLL_INTERVAL * 20)
+        self._kill()
+
+
+def run_in_child(image, params, cancel_token, timer=None):
+    """Outpaint in a one-off worker process; returns None if cancelled"""
+    worker = ChildWorker()
+    try:
+        return worker.run(image, params, cancel_token, timer)
+    finally:
+        worker.close()
+
+
+class JobQueue:
+    """Run jobs one after another on a background thread
+
+    ``on_finished(job)`` is called from the runner thread whenever a job
+    reaches a final state. Results are served from ``cache`` when given.
+    """
+
+    def __init__(self, on_finished=None, cache=None):
+        self.on_finished = on_finished
+        self.cache = cache
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._current = None
+        self._closed = False
+        self._input = None
+        self._worker = ChildWorker()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, params, meta=None):
+        """Queue a new job and return it"""
+        job = Job(image, params, meta)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Job queue is shut down")
+            self._queue.append(job)
+            self._cond.notify()
+        return job
+
+    def pending(self):
+        """Number of jobs waiting to start"""
+        with self._cond:
+            return len(self._queue)
+
+    @property
+    def current(self):
+        """The running job, if any"""
+        return self._current
+
+    def busy(self):
+        """Whether a job is running or waiting"""
+        with self._cond:
+            return self._current is not None or bool(self._queue)
+
+    def cancel_all(self):
+        """Cancel the running job and every queued one"""
+        with self._cond:
+            jobs = list(self._queue)
+            if self._current is not None:
+                jobs.append(self._current)
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self):
+        """Cancel everything and stop the runner thread"""
+        self.cancel_all()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._queue:
+                    self._release_input()
+                    self._worker.close()
+                    return
+                job = self._queue.popleft()
+                self._current = job
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._current = None
+                if self.on_finished:
+                    self.on_finished(job)
+
+    def _shared_input(self, image):
+        """Shared copy of a job's image, reused for jobs on the same image"""
+        if self._input is not None and self._input[0] is image:
+            return self._input[1]
+        self._release_input()
+        if not can_share(image.nbytes):
+            return image
+        self._input = (image, SharedArray.copy_of(image))
+        return self._input[1]
+
+    def _release_input(self):
+        if self._input is not None:
+            self._input[1].close()
+            self._input = None
+
+    def _run(self, job):
+        """Execute a job and record its final state"""
+        if job.cancelled:
+            job.state = CANCELLED
+            return
+        job.state = RUNNING
+        job.started_at = time.time()
+        try:
+            key = None
+            if self.cache is not None:
+                key = cache_key(job.image, job.params)
+                job.result = self.cache.get(key)
+            if job.result is None:
+                job.result = self._worker.run(self._shared_input(job.image), job.params,
+                                              job.cancel_token, job.timer)
+                if job.result is not None and key is not None:
+                    self.cache.put(key, job.result)
+            job.state = CANCELLED if job.result is None else DONE
+        except Exception as e:
+            job.error = e
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
@@ -0,0 +1,146 @@
+"""Two-tier image loading.
+
+Showing a thumbnail does not need the full image: the size comes from
+the file header and a reduced copy from the decoder's own downscaling
+(JPEG decodes at 1/2, 1/4 or 1/8 scale directly from the DCT
+coefficients). The full-resolution decode runs in a background thread
+the first time processing or saving asks for it.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Reduced decode flags by scale factor, largest first
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+
+# Reduced copies keep at least this many pixels on their longer side
+DISPLAY_SIDE = 1024
+
+
+def read_bytes(path):
+    """File contents as a uint8 array; works for non-ASCII paths"""
+    return np.fromfile(path, dtype=np.uint8)
+
+
+def decode(data, flags=cv2.IMREAD_COLOR):
+    """Decode encoded bytes to BGR, or None if they are not an image"""
+    if data is None or not data.size:
+        return None
+    return cv2.imdecode(data, flags)
+
+
+def header_size(path):
+    """(width, height) from the file header, or None if unreadable"""
+    # PIL only parses the header until pixels are requested
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return None
+
+
+def reduction_factor(size, min_side=DISPLAY_SIDE):
+    """Largest decoder scale factor that keeps ``min_side`` pixels"""
+    if size is None:
+        return 1
+    for factor, _ in REDUCED_FLAGS:
+        if max(size) // factor >= min_side:
+            return factor
+    return 1
+
+
+class LazyImage:
+    """An image file decoded reduced right away and full size on demand
+
+    ``preview`` is the reduced BGR copy and ``size`` the full (width,
+    height); ``decode_seconds`` adds up the time spent decoding.
+    request() starts the full decode in a background thread and
+    calls ``callback(image)`` from that thread when it is done, with None
+    if decoding failed; ``full`` is set once it succeeded.
+    """
+
+    def __init__(self, path, min_side=DISPLAY_SIDE):
+        self.path = path
+        self.full = None
+        self.error = None
+        self.decode_seconds = 0.0
+        self._data = read_bytes(path)
+        self.nbytes = int(self._data.size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._callbacks = []
+
+        start = time.perf_counter()
+        self.size = header_size(path)
+        factor = reduction_factor(self.size, min_side)
+        flags = dict(REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR)
+        self.preview = decode(self._data, flags)
+        self.decode_seconds = time.perf_counter() - start
+        if self.preview is None:
+            self.error = f"Could not decode {path}"
+            self._data = None
+            return
+        ph, pw = self.preview.shape[:2]
+        if self.size is None:
+            self.size = (pw, ph)
+        elif (pw > ph) != (self.size[0] > self.size[1]) and pw != ph:
+            # The decoder applied an EXIF rotation the header size does not have
+            self.size = self.size[::-1]
+        if not self.reduced:
+            # Small enough to have been decoded at full size already
+            self.full = self.preview
+            self._data = None
+
+    @property
+    def shape(self):
+        """Full-resolution (h, w, 3) shape"""
+        return (self.size[1], self.size[0], 3)
+
+    @property
+    def reduced(self):
+        """True when ``preview`` is smaller than the full image"""
+        return self.preview.shape[1] != self.size[0]
+
+    def request(self, callback=None):
+        """Decode the full image in the background unless already done"""
+        with self._lock:
+            if self.full is not None or self.error is not None:
+                done = True
+            else:
+                done = False
+                if callback is not None:
+                    self._callbacks.append(callback)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._decode, daemon=True)
+                    self._thread.start()
+        if done and callback is not None:
+            callback(self.full)
+
+    def load(self):
+        """Full image, waiting for the background decode if needed"""
+        self.request()
+        if self._thread is not None:
+            self._thread.join()
+        return self.full
+
+    def _decode(self):
+        start = time.perf_counter()
+        image = decode(self._data)
+        with self._lock:
+            self.decode_seconds += time.perf_counter() - start
+            if image is None:
+                self.error = f"Could not decode {self.path}"
+            else:
+                self.full = image
+            # Encoded bytes are no longer needed
+            self._data = None
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self.full)
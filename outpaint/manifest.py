@@ -0,0 +1,84 @@
+"""Append-only job manifest for resumable batches.
+
+Every finished image appends one JSON line with the input path, its size
+and mtime, a content hash and the output path. A resumed run skips inputs
+whose recorded size and mtime still match and whose output still exists,
+so only the remaining work is redone.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+MANIFEST_NAME = "outpaint_manifest.jsonl"
+
+
+def content_hash(data):
+    """Hex digest identifying the bytes of an input file"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class Manifest:
+    """JSONL record of completed inputs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """Read existing entries; a torn last line from a crash is ignored"""
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.done[entry['input']] = entry
+        return self
+
+    def is_done(self, input_path):
+        """Whether an input finished in an earlier run and is unchanged"""
+        entry = self.done.get(os.path.abspath(input_path))
+        if entry is None or not os.path.exists(entry['output']):
+            return False
+        try:
+            st = os.stat(input_path)
+        except OSError:
+            return False
+        return st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime_ns']
+
+    def record(self, input_path, output_path, digest=None):
+        """Append a completed input and flush it to disk"""
+        st = os.stat(input_path)
+        entry = {
+            'input': os.path.abspath(input_path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'hash': digest,
+            'output': os.path.abspath(output_path),
+            'time': time.time()
+        }
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            self.done[entry['input']] = entry
+
+    def close(self):
+        """Close the underlying file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
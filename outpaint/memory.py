@@ -0,0 +1,150 @@
+"""Memory-budgeted processing of very large images.
+
+The normal path keeps the input, canvas, mask and inpainting scratch
+buffers in RAM at once. When that estimate exceeds the
+budget, the canvas and mask live in memory-mapped temp files instead,
+margins are solved with the tiled executor in place, and enhancement
+runs in place strip by strip. Backends that cannot run on tiles solve
+the whole region in RAM; when that does not fit the budget they are
+refused with a MemoryError rather than run over it.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+from . import engine
+from .backends import get_backend
+from .blend import blend_seam, default_blend_width
+from .enhance import enhance_native
+from .metrics import stage
+
+# Rough working set of cv2.inpaint per canvas pixel (input and output
+# copies, flags, distance map); enhancement works in place on row strips
+INPAINT_BYTES_PER_PIXEL = 12
+ENHANCE_STRIP_BYTES_PER_PIXEL = 48
+CANVAS_BYTES_PER_PIXEL = 4
+
+# Working set per solved canvas pixel of backends without tiles, measured
+# for PatchMatch (float estimate, field, descriptors, vote accumulators)
+UNTILED_BYTES_PER_PIXEL = 256
+
+MIN_TILE_SIZE = 64
+MAX_TILE_SIZE = 4 * engine.DEFAULT_TILE_SIZE
+
+# Rows per strip for edge replication
+STRIP_ROWS = 256
+
+
+def solve_bytes_per_pixel(method):
+    """Working set of a backend per solved canvas pixel"""
+    return INPAINT_BYTES_PER_PIXEL if get_backend(method).tiles else UNTILED_BYTES_PER_PIXEL
+
+
+def estimate_peak_bytes(shape, margins, radius, mode="full", enhance=False, method="telea"):
+    """Estimated peak memory of engine.outpaint on the normal path"""
+    h, w = shape[:2]
+    top, bottom, left, right = margins
+    canvas_px = (h + top + bottom) * (w + left + right)
+
+    solved = margins
+    if mode == "band":
+        solved = engine.band_margins(margins, radius)[0]
+    solved_px = (h + solved[0] + solved[1]) * (w + solved[2] + solved[3])
+
+    solve_bytes = CANVAS_BYTES_PER_PIXEL + solve_bytes_per_pixel(method)
+    peak = h * w * 3 + solved_px * solve_bytes + canvas_px * 3
+    if enhance:
+        peak += (w + left + right) * STRIP_ROWS * ENHANCE_STRIP_BYTES_PER_PIXEL
+    return peak
+
+
+def temp_array(shape, temp_dir=None):
+    """Zero-filled uint8 array backed by an anonymous temp file"""
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+    # The mapping keeps the data alive; the file is gone once it is closed
+    with tempfile.TemporaryFile(dir=temp_dir, prefix="outpaint_") as f:
+        return np.memmap(f, dtype=np.uint8, mode='w+', shape=shape)
+
+
+def budget_tile_size(margins, radius, budget, fixed_bytes, workers):
+    """Largest tile size whose in-flight tiles fit the remaining budget"""
+    depth = max(margins) + 4 * radius
+    per_tile = max(1, budget - fixed_bytes) // (2 * workers)
+    tile_size = per_tile // (depth * (INPAINT_BYTES_PER_PIXEL + CANVAS_BYTES_PER_PIXEL)) - 4 * radius
+    return int(min(MAX_TILE_SIZE, max(MIN_TILE_SIZE, tile_size)))
+
+
+def replicate_edges(canvas, rest):
+    """Fill the outer margins by replicating the inner region, strip by strip"""
+    top, bottom, left, right = rest
+    h, w = canvas.shape[:2]
+    for y0 in range(top, h - bottom, STRIP_ROWS):
+        rows = canvas[y0:min(y0 + STRIP_ROWS, h - bottom)]
+        if left:
+            rows[:, :left] = rows[:, left:left + 1]
+        if right:
+            rows[:, w - right:] = rows[:, w - right - 1:w - right]
+    for y in range(top):
+        canvas[y] = canvas[top]
+    for y in range(h - bottom, h):
+        canvas[y] = canvas[h - bottom - 1]
+
+
+def outpaint_budgeted(image, margins, radius, method, mode="full", contrast=False, sharpness=False,
+                      budget=None, temp_dir=None, workers=None, enhance_margins_only=False,
+                      options=None, timer=None, blend=None, blend_width=None):
+    """Outpaint on memory-mapped buffers with tiles sized to the budget"""
+    workers = workers or os.cpu_count() or 1
+    h, w = image.shape[:2]
+    top, bottom, left, right = margins
+    new_h, new_w = h + top + bottom, w + left + right
+
+    inner, rest = (margins, (0, 0, 0, 0))
+    if mode == "band":
+        inner, rest = engine.band_margins(margins, radius)
+    elif mode != "full":
+        raise ValueError(f"Unknown fill mode: {mode!r}")
+
+    # Without tiles the whole inner region is solved in RAM
+    tiles = get_backend(method).tiles
+    if not tiles and budget:
+        it, ib, il, ir = inner
+        needed = image.nbytes + (h + it + ib) * (w + il + ir) * UNTILED_BYTES_PER_PIXEL
+        if needed > budget:
+            raise MemoryError(f"{method} cannot run on tiles and needs about {needed >> 20} MB, "
+                              f"over the {budget >> 20} MB memory budget; use a tiled method, "
+                              f"band mode or a larger budget")
+
+    with stage(timer, "mask"):
+        canvas = temp_array((new_h, new_w, 3), temp_dir)
+
+        # Solve the inner region (the whole canvas in full mode) in place
+        rt, rb, rl, rr = rest
+        region = canvas[rt:new_h - rb, rl:new_w - rr]
+        mask = temp_array(region.shape[:2], temp_dir)
+        mask[...] = 255
+        it, ib, il, ir = inner
+        region[it:it + h, il:il + w] = image
+        mask[it:it + h, il:il + w] = 0
+
+    with stage(timer, "inpaint"):
+        if tiles:
+            tile_size = budget_tile_size(inner, radius, budget or 0, image.nbytes, workers)
+            engine.inpaint_tiled(region, mask, inner, radius, method, tile_size, workers,
+                                 inplace=True, options=options)
+        else:
+            region[...] = engine.solve(region, mask, radius, method, options)
+        del mask
+
+        if any(rest):
+            replicate_edges(canvas, rest)
+
+    if blend not in (None, "none"):
+        with stage(timer, "blend"):
+            blend_seam(canvas, margins, blend, blend_width or default_blend_width(radius))
+
+    with stage(timer, "enhance"):
+        return enhance_native(canvas, contrast, sharpness,
+                              margins if enhance_margins_only else None, inplace=True)
@@ -0,0 +1,152 @@
+"""Stage timers and counters.
+
+A StageTimer records where the time of one run goes (decode, mask,
+inpaint, blend, enhance, encode, display). Metrics aggregates timers and
+counters over a session or batch, thread-safely, and keeps the most
+recent error messages; it exports them as JSON or in the Prometheus text
+format.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+STAGES = ("decode", "mask", "inpaint", "blend", "enhance", "encode", "display")
+
+COUNTERS = ("images_processed", "images_failed", "bytes_read", "bytes_written")
+
+METRIC_PREFIX = "outpaint"
+
+# Error messages kept by Metrics, newest last
+MAX_ERRORS = 100
+
+
+class StageTimer:
+    """Wall time per stage of a single run"""
+
+    def __init__(self, times=None):
+        self.times = dict(times or {})
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as ``name``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def update(self, times):
+        """Add the stages of another timer or times dict"""
+        for name, seconds in dict(getattr(times, 'times', times)).items():
+            self.add(name, seconds)
+
+    @property
+    def total(self):
+        return sum(self.times.values())
+
+    def summary(self):
+        """One line breakdown, in pipeline order"""
+        names = [s for s in STAGES if s in self.times] + [s for s in self.times if s not in STAGES]
+        return " | ".join(f"{name} {self.times[name]:.2f}s" for name in names)
+
+    def __repr__(self):
+        return f"StageTimer({self.summary()})"
+
+
+def stage(timer, name):
+    """timer.stage(name), or a no-op when there is no timer"""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+class Metrics:
+    """Aggregated stage times and counters, safe to share between threads
+
+    With a ``log`` file object every observed run is also appended to it
+    as one JSON line.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.stage_seconds = {}
+        self.stage_runs = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.errors = deque(maxlen=MAX_ERRORS)
+        self.last = None
+
+    def observe(self, timer, **fields):
+        """Add a finished run's stage times; ``fields`` go to the log line"""
+        with self._lock:
+            for name, seconds in timer.times.items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+                self.stage_runs[name] = self.stage_runs.get(name, 0) + 1
+            self.last = StageTimer(timer.times)
+            if self.log is not None:
+                record = {'time': time.time(), **fields,
+                          'stages': {name: round(seconds, 6) for name, seconds in timer.times.items()}}
+                self.log.write(json.dumps(record, default=str) + "\n")
+                self.log.flush()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def error(self, message, counter="images_failed"):
+        """Count a failure under ``counter`` and keep its message"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+            self.errors.append(str(message))
+
+    def mean_timer(self):
+        """StageTimer with the average time per run of each stage"""
+        with self._lock:
+            return StageTimer({name: seconds / self.stage_runs[name]
+                               for name, seconds in self.stage_seconds.items()})
+
+    def snapshot(self):
+        """Plain dict of the current values"""
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'elapsed': time.time() - self.started_at,
+                'stages': {name: {'seconds': round(seconds, 6), 'runs': self.stage_runs[name]}
+                           for name, seconds in self.stage_seconds.items()},
+                'counters': dict(self.counters),
+                'errors': list(self.errors)
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Wall time spent in each stage.",
+            f"# TYPE {prefix}_stage_seconds_total counter"
+        ]
+        for name, values in snapshot['stages'].items():
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {values["seconds"]}')
+        lines += [
+            f"# HELP {prefix}_stage_runs_total Number of timed runs of each stage.",
+            f"# TYPE {prefix}_stage_runs_total counter"
+        ]
+        for name, values in snapshot['stages'].items():
+            lines.append(f'{prefix}_stage_runs_total{{stage="{name}"}} {values["runs"]}')
+        for name, value in snapshot['counters'].items():
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt="json"):
+        """Write the metrics as 'json' or 'prometheus' text"""
+        if fmt not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics format: {fmt!r}")
+        text = self.to_json() + "\n" if fmt == "json" else self.to_prometheus()
+        with open(path, 'w') as f:
+            f.write(text)
@@ -0,0 +1,122 @@
+"""Encoding and writing results.
+
+Images are encoded in memory and written to a temp file next to the
+target that is renamed into place, so readers never see a partial file.
+ImageWriter runs encodes on a small thread pool (cv2.imencode releases
+the GIL) so writing one result overlaps with work on the next.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+OUTPUT_FORMATS = {
+    'png': '.png',
+    'jpg': '.jpg',
+    'webp': '.webp'
+}
+
+DEFAULT_QUALITY = 95
+
+# -1 keeps OpenCV's PNG defaults (level 1 with the fast RLE strategy);
+# any explicit level also switches zlib to its default, slower strategy
+DEFAULT_PNG_COMPRESSION = -1
+
+DEFAULT_WRITERS = 2
+
+
+def output_extension(fmt):
+    """File extension for an output format name"""
+    try:
+        return OUTPUT_FORMATS[fmt]
+    except KeyError:
+        raise ValueError(f"Unknown output format: {fmt!r}") from None
+
+
+def format_params(ext, quality=DEFAULT_QUALITY, png_compression=DEFAULT_PNG_COMPRESSION):
+    """cv2 encoder parameters for a file extension"""
+    ext = ext.lower()
+    if ext in ('.jpg', '.jpeg'):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if ext == '.webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    if ext == '.png' and png_compression is not None and png_compression >= 0:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    return []
+
+
+def encode_params(path, quality=DEFAULT_QUALITY, png_compression=DEFAULT_PNG_COMPRESSION):
+    """cv2 encoder parameters for the format implied by a path"""
+    return format_params(os.path.splitext(path)[1], quality, png_compression)
+
+
+def encode_image(image, ext='.png', params=None):
+    """Encode an image in memory; returns a uint8 array"""
+    ok, data = cv2.imencode(ext, image, params or [])
+    if not ok:
+        raise IOError(f"Could not encode image as {ext}")
+    return data
+
+
+def write_atomic(path, image, params=None):
+    """Encode an image and move it into place; returns the bytes written"""
+    data = encode_image(image, os.path.splitext(path)[1] or '.png', params)
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        # tofile handles non-ASCII paths that cv2.imwrite cannot
+        data.tofile(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return int(data.size)
+
+
+class ImageWriter:
+    """Thread pool writing images atomically in the background
+
+    submit() returns a Future resolving to (path, bytes written, seconds);
+    at most ``max_pending`` images wait in memory, further submits block.
+    """
+
+    def __init__(self, quality=DEFAULT_QUALITY, png_compression=DEFAULT_PNG_COMPRESSION,
+                 workers=DEFAULT_WRITERS, max_pending=None):
+        self.quality = quality
+        self.png_compression = png_compression
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * workers)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="writer")
+
+    def params(self, path):
+        return encode_params(path, self.quality, self.png_compression)
+
+    def write(self, path, image, params=None):
+        """Write synchronously; returns (path, bytes written, seconds)"""
+        start = time.perf_counter()
+        size = write_atomic(path, image, self.params(path) if params is None else params)
+        return path, size, time.perf_counter() - start
+
+    def submit(self, path, image, params=None):
+        """Queue an image for writing, with the writer's params unless given"""
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self.write, path, np.ascontiguousarray(image), params)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self, wait=True):
+        """Finish queued writes and stop the threads"""
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,358 @@
+"""Exemplar-based outpainting with randomized PatchMatch.
+
+Margins are synthesised from patches of the original region instead of
+being diffused from the seam, so texture survives wide expansions. Every
+level of an optional image pyramid alternates a nearest-neighbour field
+search (jump-flooding propagation plus random search, vectorised over all
+target patches) with a vote in which each unknown pixel becomes the
+weighted average of the source pixels that the patches covering it point
+to. The coarsest level starts from the Poisson fill; finer levels start
+from the upsampled result and field.
+
+Patches are compared through a compact descriptor, the averages of a
+4x4 grid of cells covering the patch, so one distance is a single row
+gather per patch instead of one gather per pixel. Source patches lie in
+the known rectangle, so their descriptors are built once per level; a
+vote only invalidates the target descriptors, which are rebuilt when the
+next search needs them. Everything runs on the CPU in NumPy.
+
+``time_budget`` is a soft target: the deadline is checked between the
+steps of a search, and once it has passed the last result is upsampled
+to the full canvas instead of setting up the remaining levels, so a run
+overshoots by at most one search step and one vote.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from .backends import fill_poisson, known_box, widest_margin
+
+PATCH_SIZE = 7
+ITERATIONS = 4
+
+# Longest propagation jump; matches spread up to twice this per pass
+JUMP = 8
+
+# Pyramid levels stop once the widest margin is this many patches wide
+COARSE_MARGIN_PATCHES = 3
+
+# Patch distances are computed this many targets at a time
+CHUNK = 1 << 16
+
+
+def patchmatch_levels(shape, margin, known_shape, patch_size=PATCH_SIZE):
+    """Number of 2x downsampling steps for the multiscale search"""
+    levels = 0
+    min_known = min(known_shape[:2])
+    while ((margin >> levels) > COARSE_MARGIN_PATCHES * patch_size and
+           (min_known >> (levels + 1)) >= 2 * patch_size and
+           (min(shape[:2]) >> (levels + 1)) >= 2 * patch_size):
+        levels += 1
+    return levels
+
+
+def descriptor_grid(patch_size):
+    """Cell size and offsets of the 4x4 cells that tile a patch"""
+    half = patch_size // 2
+    cell = max(1, (patch_size + 3) // 4)
+    starts = [-half + cell * k for k in range(4)]
+    return cell, [(dy, dx) for dy in starts for dx in starts]
+
+
+def vote_grid(patch_size):
+    """Offsets of the patch centres that vote for a pixel"""
+    step = max(1, patch_size // 2 - 1)
+    return [(dy * step, dx * step) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+
+class _Field:
+    """Nearest-neighbour field of the target patches at one level"""
+
+    def __init__(self, image, unknown, box, patch_size, rng, deadline=None):
+        self.h, self.w = unknown.shape
+        self.rng = rng
+        self.deadline = deadline
+        self.half = half = patch_size // 2
+        self.cell, self.grid = descriptor_grid(patch_size)
+        self.voters = vote_grid(patch_size)
+
+        # Target patches: every centre whose patch touches an unknown pixel
+        size = 2 * half + 1
+        touched = cv2.dilate(unknown.astype(np.uint8), np.ones((size, size), np.uint8)) > 0
+        self.ty, self.tx = np.nonzero(touched)
+        self.index = np.full((self.h, self.w), -1, dtype=np.int64)
+        self.index[self.ty, self.tx] = np.arange(self.ty.size)
+
+        # Source patches and their descriptor cells lie inside the known rectangle
+        y0, y1, x0, x1 = box
+        reach = max(half, 4 * self.cell - 1 - half)
+        self.src_y = (y0 + half, y1 - reach - 1)
+        self.src_x = (x0 + half, x1 - reach - 1)
+
+        self.uy, self.ux = np.nonzero(unknown)
+        self.sy = self.sx = self.cost = None
+        self.source_features = self._target_features = None
+        self._votes = None
+        self.set_image(image)
+
+    def expired(self):
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def set_image(self, image):
+        """Use a new estimate of the canvas; target descriptors go stale"""
+        self.image = image
+        self._target_features = None
+
+    def _cell_averages(self):
+        """Cell averages anchored at their top-left pixel, padded for the grid"""
+        cell = self.cell
+        averages = cv2.blur(self.image, (cell, cell), anchor=(0, 0))
+        pad = self.half + cell
+        return cv2.copyMakeBorder(averages, pad, pad, pad, pad, cv2.BORDER_REFLECT_101), pad
+
+    def _build_source_features(self):
+        """Descriptors of every source position, one row per (sy, sx)"""
+        padded, pad = self._cell_averages()
+        (y0, y1), (x0, x1) = self.src_y, self.src_x
+        h, w = y1 - y0 + 1, x1 - x0 + 1
+        features = np.empty((h, w, len(self.grid), 3), dtype=np.uint8)
+        for i, (dy, dx) in enumerate(self.grid):
+            ry, rx = pad + y0 + dy, pad + x0 + dx
+            np.clip(padded[ry:ry + h, rx:rx + w] + 0.5, 0, 255, out=features[:, :, i],
+                    casting='unsafe')
+        self.source_features = features.reshape(h * w, -1)
+
+    @property
+    def target_features(self):
+        """Descriptors of the target patches for the current estimate"""
+        if self._target_features is None:
+            padded, pad = self._cell_averages()
+            features = np.empty((self.ty.size, len(self.grid), 3), dtype=np.uint8)
+            for i, (dy, dx) in enumerate(self.grid):
+                np.clip(padded[self.ty + pad + dy, self.tx + pad + dx] + 0.5, 0, 255,
+                        out=features[:, i], casting='unsafe')
+            self._target_features = features.reshape(self.ty.size, -1)
+        return self._target_features
+
+    def _clip(self, sy, sx):
+        return (np.clip(sy, *self.src_y), np.clip(sx, *self.src_x))
+
+    def distance(self, targets, sy, sx):
+        """Squared descriptor distance between target and source patches"""
+        if self.source_features is None:
+            # Source patches only cover known pixels, which votes never change
+            self._build_source_features()
+        target_features = self.target_features[targets]
+        sources = (sy - self.src_y[0]) * (self.src_x[1] - self.src_x[0] + 1) + (sx - self.src_x[0])
+        cost = np.empty(sources.size, dtype=np.float32)
+        for start in range(0, sources.size, CHUNK):
+            stop = start + CHUNK
+            diff = target_features[start:stop].astype(np.float32)
+            diff -= self.source_features[sources[start:stop]]
+            cost[start:stop] = np.einsum('ij,ij->i', diff, diff)
+        return cost
+
+    def initialise(self, coarse=None):
+        """Random field, or the upsampled field of the coarser level"""
+        if coarse is None:
+            sy = self.rng.integers(self.src_y[0], self.src_y[1] + 1, self.ty.size)
+            sx = self.rng.integers(self.src_x[0], self.src_x[1] + 1, self.ty.size)
+        else:
+            cy, cx = coarse
+            ch, cw = cy.shape
+            py = np.minimum(self.ty // 2, ch - 1)
+            px = np.minimum(self.tx // 2, cw - 1)
+            sy = cy[py, px] * 2 + self.ty % 2
+            sx = cx[py, px] * 2 + self.tx % 2
+        self.sy, self.sx = self._clip(sy, sx)
+
+    def dense(self):
+        """Field as (h, w) source coordinate maps for upsampling"""
+        sy = np.zeros((self.h, self.w), dtype=np.int64)
+        sx = np.zeros((self.h, self.w), dtype=np.int64)
+        sy[self.ty, self.tx] = self.sy
+        sx[self.ty, self.tx] = self.sx
+
+        # Centres outside the targets point at the nearest source position
+        oy, ox = np.nonzero(self.index < 0)
+        sy[oy, ox] = np.clip(oy, *self.src_y)
+        sx[oy, ox] = np.clip(ox, *self.src_x)
+        return sy, sx
+
+    def _try(self, targets, sy, sx):
+        """Keep candidates that beat the current matches"""
+        sy, sx = self._clip(sy, sx)
+        cost = self.distance(targets, sy, sx)
+        better = cost < self.cost[targets]
+        targets = targets[better]
+        self.sy[targets] = sy[better]
+        self.sx[targets] = sx[better]
+        self.cost[targets] = cost[better]
+
+    def propagate(self, step, reverse=False):
+        """Offer each target its neighbours' matches, shifted along"""
+        sign = -1 if reverse else 1
+        for dy, dx in ((step * sign, 0), (0, step * sign)):
+            ny, nx = self.ty - dy, self.tx - dx
+            inside = (ny >= 0) & (ny < self.h) & (nx >= 0) & (nx < self.w)
+            neighbours = np.full(self.ty.size, -1, dtype=np.int64)
+            neighbours[inside] = self.index[ny[inside], nx[inside]]
+            targets = np.nonzero(neighbours >= 0)[0]
+            neighbours = neighbours[targets]
+            self._try(targets, self.sy[neighbours] + dy, self.sx[neighbours] + dx)
+
+    def random_search(self, radius):
+        """Try random matches in windows shrinking around the current ones"""
+        targets = np.arange(self.ty.size)
+        while radius >= 1 and not self.expired():
+            sy = self.sy + self.rng.integers(-radius, radius + 1, targets.size)
+            sx = self.sx + self.rng.integers(-radius, radius + 1, targets.size)
+            self._try(targets, sy, sx)
+            radius //= 2
+
+    def search(self, iteration, radius):
+        """One PatchMatch pass: jump-flooding propagation, then random search
+
+        Returns False when the deadline passed before the pass finished.
+        """
+        # Building source descriptors and recomputing every distance are the
+        # longest steps, so each is only started in time
+        if self.source_features is None:
+            if self.expired():
+                return False
+            self._build_source_features()
+        if self.expired():
+            return False
+        # Distances are stale after a vote changed the estimate
+        self.cost = self.distance(slice(None), self.sy, self.sx)
+        reverse = bool(iteration % 2)
+        step = JUMP
+        while step >= 1:
+            if self.expired():
+                return False
+            self.propagate(step, reverse)
+            step //= 2
+        if self.expired():
+            return False
+        self.random_search(radius)
+        return True
+
+    def _voting(self):
+        """Per voter: flat offset and the target centred there for each unknown pixel
+
+        Pixels without such a target get the index one past the last
+        target, which votes with weight 0. Only depends on the masks, so
+        it is built once per level.
+        """
+        if self._votes is None:
+            index = self.index.ravel()
+            self._votes = []
+            for dy, dx in self.voters:
+                cy, cx = self.uy - dy, self.ux - dx
+                inside = (cy >= 0) & (cy < self.h) & (cx >= 0) & (cx < self.w)
+                targets = np.full(self.uy.size, -1, dtype=np.int64)
+                targets[inside] = index[cy[inside] * self.w + cx[inside]]
+                targets[targets < 0] = self.ty.size
+                self._votes.append((dy * self.w + dx, targets))
+        return self._votes
+
+    def vote(self):
+        """Rebuild the unknown pixels from the matched source patches
+
+        Each unknown pixel averages the patches centred on a sparse grid
+        around it, weighted by how well they matched.
+        """
+        if self.cost is None:
+            weights = np.ones(self.ty.size, dtype=np.float32)
+        else:
+            weights = np.exp(-self.cost / (self.cost.mean() + 1e-6))
+        # Entry past the last target: zero weight, any in-range source
+        weights = np.append(weights.astype(np.float32), np.float32(0))
+        sources = np.append(self.sy * self.w + self.sx, self.src_y[0] * self.w + self.src_x[0])
+        total = np.zeros((self.uy.size, 3), dtype=np.float32)
+        norm = np.zeros(self.uy.size, dtype=np.float32)
+        pixels_flat = self.image.reshape(-1, 3)
+        for offset, targets in self._voting():
+            w = np.take(weights, targets)
+            total += np.take(pixels_flat, np.take(sources, targets) + offset, axis=0) * w[:, None]
+            norm += w
+        image = self.image.copy()
+        image[self.uy, self.ux] = total / np.maximum(norm, 1e-6)[:, None]
+        self.set_image(image)
+
+
+def fill_patchmatch(canvas, mask, radius=None, patch_size=PATCH_SIZE, iterations=ITERATIONS,
+                    multiscale=True, time_budget=None, seed=None):
+    """Fill the masked area of a canvas with patches of its known rectangle
+
+    ``iterations`` search/vote rounds run at the coarsest level and fewer
+    at each finer one, where the random search stays near the upsampled
+    matches. ``time_budget`` is a soft target: once it has passed, the
+    current search stops after its step and the last result is upsampled
+    to the canvas.
+    """
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    box = known_box(mask)
+    if box is None or min(box[1] - box[0], box[3] - box[2]) <= patch_size:
+        return fill_poisson(canvas, mask)
+
+    levels = 0
+    if multiscale:
+        levels = patchmatch_levels(mask.shape, widest_margin(mask),
+                                   (box[1] - box[0], box[3] - box[2]), patch_size)
+
+    # Pyramid; any partially masked pixel stays masked
+    images = [canvas]
+    masks = [mask]
+    for _ in range(levels):
+        h, w = masks[-1].shape
+        size = (max(1, w // 2), max(1, h // 2))
+        images.append(cv2.resize(images[-1], size, interpolation=cv2.INTER_AREA))
+        masks.append(np.where(cv2.resize(masks[-1], size, interpolation=cv2.INTER_AREA) > 0,
+                              np.uint8(255), np.uint8(0)))
+
+    rng = np.random.default_rng(seed)
+    result = coarse = None
+    for level in range(levels, -1, -1):
+        image, level_mask = images[level], masks[level]
+        h, w = level_mask.shape
+        unknown = level_mask > 0
+
+        # Initial estimate of the unknown pixels
+        estimate = image.astype(np.float32)
+        if result is None:
+            estimate[unknown] = fill_poisson(image, level_mask)[unknown]
+        elif deadline is not None and time.perf_counter() > deadline:
+            # Out of time: the coarser result stands in for the remaining levels
+            break
+        else:
+            upsampled = cv2.resize(result, (w, h), interpolation=cv2.INTER_LINEAR)
+            estimate[unknown] = upsampled[unknown]
+        result = estimate
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+
+        field = _Field(estimate, unknown, known_box(level_mask), patch_size, rng, deadline)
+        field.initialise(coarse)
+
+        # The coarsest level searches the whole source, finer ones locally
+        if level == levels:
+            rounds, search_radius = iterations, max(h, w)
+        else:
+            rounds, search_radius = max(1, iterations >> (levels - level)), JUMP
+        for i in range(rounds):
+            if not field.search(i, search_radius):
+                break
+            field.vote()
+
+        result = field.image
+        if level and not field.expired():
+            coarse = field.dense()
+
+    if result.shape[:2] != mask.shape:
+        result = cv2.resize(result, (mask.shape[1], mask.shape[0]), interpolation=cv2.INTER_LINEAR)
+    result = np.clip(result + 0.5, 0, 255).astype(np.uint8)
+    known = mask == 0
+    result[known] = canvas[known]
+    return result
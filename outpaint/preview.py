@@ -0,0 +1,107 @@
+"""Fast interactive previews.
+
+A pyramid of aspect-correct downscaled copies is built once per loaded
+image; previews run on the level that matches the preview size, on a
+background worker that always skips to the newest request.
+"""
+import threading
+
+import cv2
+
+from . import engine
+
+# Levels stop halving below this long side
+MIN_LEVEL_SIDE = 64
+
+
+def build_preview_pyramid(image, min_side=MIN_LEVEL_SIDE):
+    """Successive half-size copies of an image, largest first"""
+    levels = [image]
+    while max(levels[-1].shape[:2]) // 2 >= min_side:
+        h, w = levels[-1].shape[:2]
+        levels.append(cv2.resize(levels[-1], (max(1, w // 2), max(1, h // 2)),
+                                 interpolation=cv2.INTER_AREA))
+    return levels
+
+
+def preview_level(levels, max_side):
+    """Smallest level whose long side still covers max_side"""
+    for level in reversed(levels):
+        if max(level.shape[:2]) >= max_side:
+            return level
+    return levels[0]
+
+
+def preview_params(full_shape, level_shape, params):
+    """Scale engine parameters from full resolution to a preview level"""
+    scale = level_shape[1] / full_shape[1]
+    scaled = dict(params)
+    margins = engine.outpaint_margins(full_shape, **engine.margin_params(params))
+    for key in ('expansion', 'aspect', 'target_size'):
+        scaled.pop(key, None)
+    scaled['margins'] = tuple(max(1, round(m * scale)) if m else 0 for m in margins)
+    scaled['radius'] = max(2, round(engine.inpaint_radius(max(margins)) * scale))
+    if params.get('blend_width'):
+        scaled['blend_width'] = max(1, round(params['blend_width'] * scale))
+    for key in ('tile_size', 'workers', 'memory_budget', 'temp_dir'):
+        scaled.pop(key, None)
+    return scaled
+
+
+class PreviewWorker:
+    """Background thread that renders only the latest preview request
+
+    ``callback(request_id, result, error)`` is called from the worker
+    thread for requests that are still current when they finish; requests
+    superseded while waiting are dropped without being rendered.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._cond = threading.Condition()
+        self._request = None
+        self._current = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, params):
+        """Queue a preview, replacing any request not yet started"""
+        with self._cond:
+            self._current += 1
+            self._request = (self._current, image, params)
+            self._cond.notify()
+            return self._current
+
+    def cancel(self):
+        """Drop the pending request and ignore the one in progress"""
+        with self._cond:
+            self._current += 1
+            self._request = None
+
+    def close(self):
+        """Stop the worker thread"""
+        with self._cond:
+            self._closed = True
+            self._request = None
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._request is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                request_id, image, params = self._request
+                self._request = None
+
+            try:
+                result, error = engine.outpaint(image, **params), None
+            except Exception as e:
+                result, error = None, e
+
+            with self._cond:
+                stale = request_id != self._current
+            if not stale:
+                self.callback(request_id, result, error)
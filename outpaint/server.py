@@ -0,0 +1,421 @@
+"""Local HTTP outpainting service.
+
+    python -m outpaint serve --port 8765 --workers 4
+    curl --data-binary @photo.jpg 'http://127.0.0.1:8765/outpaint?expansion=120&format=jpg' -o out.jpg
+
+POST /outpaint takes the encoded image as the request body and the
+engine parameters as query arguments (expansion, direction, method, mode,
+contrast, sharpness, enhance_margins_only, blend, blend_width,
+time_budget) plus the output format, quality and png_compression;
+missing ones fall back to the server defaults. ``margins`` (top,bottom,
+left,right), ``aspect`` (16:9) or ``size`` (1920x1080) replace the
+expansion preset. The result is streamed back with chunked transfer
+encoding. GET /health reports the queue state and GET /metrics the stage
+times in the Prometheus text format.
+
+Built on asyncio streams only. Decoding, outpainting and encoding all run
+in a process pool, so just encoded bytes cross the process boundary.
+Requests wait in a bounded admission queue and are refused with 429 once
+it is full. Small requests are coalesced into one pool task, and
+identical requests in flight share one result.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from . import engine
+from .backends import backend_names
+from .blend import BLEND_MODES
+from .metrics import Metrics, StageTimer
+from .output import encode_image, format_params, output_extension
+from .tuning import make_pool, pool_params
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Requests admitted beyond the ones being processed
+DEFAULT_QUEUE_SIZE = 16
+
+# Bodies up to this size count as small and are coalesced, at most
+# COALESCE_MAX to a pool task
+SMALL_BYTES = 256 * 1024
+COALESCE_MAX = 8
+
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+# Size of the chunks the response body is streamed in
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.webp': 'image/webp'
+}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable"
+}
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+class RequestError(Exception):
+    """A request the server refuses, with the HTTP status to answer"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def request_params(query, defaults):
+    """Engine parameters and output options from a query string
+
+    Returns (params for engine.outpaint, output extension, encoder
+    parameters); raises RequestError for invalid values.
+    """
+    values = {key: items[-1] for key, items in parse_qs(query, keep_blank_values=True).items()}
+    params = dict(defaults)
+    try:
+        # expansion_size is the GUI's name for it
+        expansion = values.get('expansion', values.get('expansion_size'))
+        if expansion is not None:
+            params['expansion'] = int(expansion)
+        for key, choices in (('direction', engine.DIRECTIONS), ('method', backend_names()),
+                             ('mode', engine.MODES), ('blend', BLEND_MODES)):
+            if key in values:
+                if values[key] not in choices:
+                    raise ValueError(f"{key} must be one of {', '.join(choices)}")
+                params[key] = values[key]
+        for key in ('contrast', 'sharpness', 'enhance_margins_only'):
+            if key in values:
+                params[key] = values[key].lower() in _TRUE
+        if 'margins' in values:
+            params['margins'] = engine.parse_margins(values['margins'])
+        if 'aspect' in values:
+            params['aspect'] = engine.parse_aspect(values['aspect'])
+        if 'size' in values:
+            params['target_size'] = engine.parse_size(values['size'])
+        if 'blend_width' in values:
+            params['blend_width'] = int(values['blend_width']) or None
+        if 'time_budget' in values:
+            params['backend_options'] = {'time_budget': float(values['time_budget']) or None}
+
+        ext = output_extension(values.get('format', 'png'))
+        quality = int(values.get('quality', 95))
+        png_compression = int(values.get('png_compression', -1))
+    except ValueError as e:
+        raise RequestError(400, str(e)) from None
+
+    if params['expansion'] < 0 or not 0 <= quality <= 100 or not -1 <= png_compression <= 9:
+        raise RequestError(400, "expansion, quality or png_compression out of range")
+    return params, ext, format_params(ext, quality, png_compression)
+
+
+def process_batch(items):
+    """Pool task: decode, outpaint and encode each (data, params, ext, encoder params)
+
+    Returns one (encoded bytes or None, stage times, error) per item;
+    invalid input is reported with status 400.
+    """
+    results = []
+    for data, params, ext, encoder_params in items:
+        timer = StageTimer()
+        try:
+            with timer.stage("decode"):
+                image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Could not decode the image")
+            result = engine.outpaint(image, builder=engine.thread_builder(), timer=timer, **params)
+            with timer.stage("encode"):
+                encoded = encode_image(result, ext, encoder_params).tobytes()
+            results.append((encoded, timer.times, None))
+        except ValueError as e:
+            results.append((None, timer.times, (400, str(e))))
+        except Exception as e:
+            results.append((None, timer.times, (500, f"{type(e).__name__}: {e}")))
+    return results
+
+
+class _Request:
+    """An admitted request waiting for its result"""
+
+    def __init__(self, data, params, ext, encoder_params, future):
+        self.data = data
+        self.params = params
+        self.ext = ext
+        self.encoder_params = encoder_params
+        self.future = future
+        self.admitted_at = time.perf_counter()
+
+    @property
+    def small(self):
+        return len(self.data) <= SMALL_BYTES
+
+
+class OutpaintServer:
+    """asyncio HTTP server in front of a process pool
+
+    ``defaults`` are the engine.outpaint parameters used for anything a
+    request leaves out. ``policy`` (a tuning.ThreadPolicy) sets the
+    OpenCV threads and CPU affinity of the pool's processes.
+    """
+
+    def __init__(self, defaults, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 coalesce=COALESCE_MAX, max_body=MAX_BODY_BYTES, metrics=None, policy=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = policy.for_workers(self.workers) if policy is not None else None
+        self.defaults = pool_params(defaults, self.policy)
+        self.queue_size = queue_size
+        self.coalesce = max(1, coalesce)
+        self.max_body = max_body
+        self.metrics = metrics or Metrics()
+        self.pool = None
+        self.server = None
+        self._queue = deque()
+        self._inflight = {}
+        self._running = 0
+        self._ready = None
+        self._slots = None
+        self._dispatcher = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start the pool and listen; returns the bound (host, port)"""
+        self.pool = make_pool("process", self.workers, self.policy)
+        self._ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        """Stop listening, fail queued requests and shut the pool down"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        while self._queue:
+            request = self._queue.popleft()
+            if not request.future.done():
+                request.future.set_exception(RequestError(503, "Server shutting down"))
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT, on_ready=None):
+        """Serve until cancelled; ``on_ready(host, port)`` is called once listening"""
+        address = await self.start(host, port)
+        if on_ready:
+            on_ready(*address)
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    def stats(self):
+        """Queue state for GET /health"""
+        return {
+            'queued': len(self._queue),
+            'queue_size': self.queue_size,
+            'running_tasks': self._running,
+            'workers': self.workers,
+            'counters': self.metrics.snapshot()['counters']
+        }
+
+    def submit(self, data, params, ext, encoder_params):
+        """Admit a request; the returned future resolves to (bytes, stage times)
+
+        Raises RequestError(429) when the admission queue is full.
+        """
+        key = hashlib.blake2b(data, digest_size=16)
+        key.update(json.dumps([params, ext, encoder_params], sort_keys=True, default=str).encode())
+        key = key.hexdigest()
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+        if len(self._queue) >= self.queue_size:
+            raise RequestError(429, "Queue is full, retry later")
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        self._queue.append(_Request(data, params, ext, encoder_params, future))
+        self._ready.set()
+        return future
+
+    async def _dispatch(self):
+        """Hand queued requests to the pool, one task per free worker"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            while not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+
+            # Small requests queued back to back share a task
+            batch = [self._queue.popleft()]
+            while (batch[0].small and self._queue and self._queue[0].small and
+                   len(batch) < self.coalesce):
+                batch.append(self._queue.popleft())
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch):
+        self._running += 1
+        try:
+            started = time.perf_counter()
+            items = [(r.data, r.params, r.ext, r.encoder_params) for r in batch]
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, process_batch, items)
+            except Exception as e:
+                results = [(None, {}, (500, f"{type(e).__name__}: {e}"))] * len(batch)
+            for request, (encoded, times, error) in zip(batch, results):
+                timer = StageTimer(times)
+                timer.add("queue", started - request.admitted_at)
+                if request.future.done():
+                    continue
+                if error is None:
+                    request.future.set_result((encoded, timer))
+                else:
+                    request.future.set_exception(RequestError(*error))
+        finally:
+            self._running -= 1
+            self._slots.release()
+
+    async def _handle(self, reader, writer):
+        """Serve the requests of one connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = await self._respond(request_line, reader, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _respond(self, request_line, reader, writer):
+        """Answer one request; returns whether the connection stays open"""
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            await self._send_error(writer, RequestError(400, "Malformed request line"), False)
+            return False
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = (headers.get('connection', '').lower() != 'close' and
+                      version.upper() == 'HTTP/1.1')
+
+        url = urlsplit(target)
+        try:
+            if url.path == '/outpaint':
+                if method != 'POST':
+                    raise RequestError(405, "Use POST")
+                await self._outpaint(url.query, headers, reader, writer, keep_alive)
+            elif url.path in ('/health', '/metrics') and method == 'GET':
+                if url.path == '/health':
+                    body = json.dumps(self.stats()).encode()
+                    content_type = 'application/json'
+                else:
+                    body = self.metrics.to_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                await self._send(writer, 200, body, content_type, keep_alive)
+            else:
+                raise RequestError(404, f"No such endpoint: {url.path}")
+        except RequestError as e:
+            # An unread request body leaves the connection out of sync
+            if e.status in (405, 411, 413):
+                keep_alive = False
+            await self._send_error(writer, e, keep_alive)
+        return keep_alive
+
+    async def _outpaint(self, query, headers, reader, writer, keep_alive):
+        try:
+            length = int(headers['content-length'])
+        except (KeyError, ValueError):
+            raise RequestError(411, "Content-Length required") from None
+        if length > self.max_body:
+            raise RequestError(413, f"Image larger than {self.max_body} bytes")
+        data = await reader.readexactly(length)
+        if not data:
+            raise RequestError(400, "Empty body")
+
+        params, ext, encoder_params = request_params(query, self.defaults)
+        self.metrics.count("bytes_read", len(data))
+        try:
+            encoded, timer = await asyncio.shield(self.submit(data, params, ext, encoder_params))
+        except RequestError as e:
+            if e.status != 429:
+                self.metrics.error(f"/outpaint: {e}")
+            raise
+        self.metrics.observe(timer, path="/outpaint", bytes=len(encoded))
+        self.metrics.count("images_processed")
+        self.metrics.count("bytes_written", len(encoded))
+
+        await self._stream(writer, encoded, CONTENT_TYPES[ext], keep_alive,
+                           {'X-Outpaint-Stages': timer.summary()})
+
+    def _head(self, status, content_type, keep_alive, extra=None):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                 f"Content-Type: {content_type}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in (extra or {}).items()]
+        return ("\r\n".join(lines) + "\r\n").encode('latin-1')
+
+    async def _send(self, writer, status, body, content_type, keep_alive, extra=None):
+        writer.write(self._head(status, content_type, keep_alive, extra) +
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _send_error(self, writer, error, keep_alive):
+        extra = {'Retry-After': '1'} if error.status == 429 else None
+        body = json.dumps({'error': str(error)}).encode()
+        await self._send(writer, error.status, body, 'application/json', keep_alive, extra)
+
+    async def _stream(self, writer, body, content_type, keep_alive, extra=None):
+        """Send a body in chunks, waiting for slow clients between them"""
+        writer.write(self._head(200, content_type, keep_alive, extra) +
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        view = memoryview(body)
+        for start in range(0, len(view), CHUNK_SIZE):
+            chunk = view[start:start + CHUNK_SIZE]
+            writer.write(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def serve(defaults, host=DEFAULT_HOST, port=DEFAULT_PORT, on_ready=None, **options):
+    """Run an OutpaintServer until interrupted"""
+    server = OutpaintServer(defaults, **options)
+    try:
+        asyncio.run(server.serve_forever(host, port, on_ready))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,59 @@
+"""Shared application settings stored in config.json."""
+import json
+import os
+
+PROJECT_PATH = "Project_image_outpainting_app"
+
+DEFAULT_SETTINGS = {
+    'last_expansion_size': 50,
+    'last_direction': 'all',
+    'last_fit': '',
+    'last_method': 'telea',
+    'auto_save': True,
+    'band_mode': False,
+    'tiled': False,
+    'live_preview': True,
+    'enhance_margins_only': False,
+    'blend': 'none',
+    'blend_width': 0,
+    'batch_workers': 0,
+    'batch_executor': 'process',
+    'batch_threads': None,
+    'cpu_affinity': 'none',
+    'batch_tuning': None,
+    'cache_size_mb': 1024,
+    'memory_budget_mb': 4096,
+    'time_budget': 0,
+    'output_format': 'png',
+    'png_compression': -1,
+    'quality': 95,
+    'preview_size': 300
+}
+
+
+def settings_path(project_path=PROJECT_PATH):
+    """Location of config.json inside a project folder"""
+    return os.path.join(project_path, 'settings', 'config.json')
+
+
+def load_settings(path=None):
+    """Load settings, falling back to defaults for missing keys"""
+    settings = dict(DEFAULT_SETTINGS)
+    path = path or settings_path()
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                settings.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return settings
+
+
+def save_settings(settings, path=None):
+    """Write settings back to config.json"""
+    path = path or settings_path()
+    try:
+        with open(path, 'w') as f:
+            json.dump(settings, f, indent=2)
+    except OSError:
+        pass
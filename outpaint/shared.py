@@ -0,0 +1,153 @@
+"""Shared-memory transport for images.
+
+Worker processes get their input and write their result through named
+``multiprocessing.shared_memory`` blocks instead of pickling arrays
+through a pipe: only a small handle (name, shape, dtype) crosses the
+process boundary. The parent copies an input in once, or not at all when
+it is already shared, and uses the result block as the result array.
+
+Arrays taken from a SharedArray outlive close(): the block's name is
+freed right away, its mapping once the last array viewing it is gone.
+At exit, open SharedArrays are closed and blocks still viewed by arrays
+are detached, so their mappings go with the process.
+"""
+import atexit
+import os
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Where POSIX shared memory lives; blocks larger than its free space would
+# fault on first write instead of failing cleanly
+SHM_DIR = "/dev/shm"
+
+# Free space left for everything else on SHM_DIR
+SHM_RESERVE = 64 * 1024 * 1024
+
+# Blocks whose mapping is still viewed by arrays, closed by collect()
+_deferred = []
+_deferred_lock = threading.Lock()
+
+# SharedArrays not closed yet, closed at exit
+_open = weakref.WeakSet()
+
+
+def _try_close(shm):
+    """Close a block; False while arrays still view it"""
+    try:
+        shm.close()
+    except BufferError:
+        return False
+    return True
+
+
+def collect():
+    """Unmap closed blocks whose last array has been freed"""
+    with _deferred_lock:
+        _deferred[:] = [shm for shm in _deferred if not _try_close(shm)]
+
+
+def _detach(shm):
+    """Forget a block's mapping without closing it, so __del__ does not raise"""
+    shm._buf = None
+    shm._mmap = None
+    shm.close()
+
+
+@atexit.register
+def _shutdown():
+    """Close open SharedArrays and detach blocks arrays still view"""
+    for shared in list(_open):
+        shared.close()
+    with _deferred_lock:
+        for shm in _deferred:
+            if not _try_close(shm):
+                _detach(shm)
+        _deferred.clear()
+
+
+def can_share(nbytes):
+    """Whether a block of ``nbytes`` fits in shared memory"""
+    if not hasattr(os, 'statvfs') or not os.path.isdir(SHM_DIR):
+        return True
+    try:
+        st = os.statvfs(SHM_DIR)
+    except OSError:
+        return False
+    return st.f_bavail * st.f_frsize >= nbytes + SHM_RESERVE
+
+
+class SharedArray:
+    """NumPy array in a named shared memory block
+
+    ``handle`` is a small picklable tuple another process passes to
+    attach() to map the same pixels without copying them. The process
+    that created the block frees its name on close().
+    """
+
+    def __init__(self, shm, shape, dtype, owner):
+        self._shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        # frombuffer holds a buffer export, so the block cannot be unmapped
+        # under the array; np.ndarray(buffer=...) does not
+        count = int(np.prod(self.shape))
+        self.array = np.frombuffer(shm.buf, self.dtype, count).reshape(self.shape)
+        _open.add(self)
+
+    @classmethod
+    def create(cls, shape, dtype=np.uint8):
+        """New uninitialised block"""
+        collect()
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        return cls(shared_memory.SharedMemory(create=True, size=max(1, size)), shape, dtype, True)
+
+    @classmethod
+    def copy_of(cls, array):
+        """New block holding a copy of ``array``"""
+        shared = cls.create(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """Map a block created by another process"""
+        name, shape, dtype = handle
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, False)
+
+    @property
+    def handle(self):
+        return (self._shm.name, self.shape, self.dtype.str)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def close(self):
+        """Drop this handle to the block; arrays taken from it stay valid"""
+        if self._shm is None:
+            return
+        shm, self._shm = self._shm, None
+        self.array = None
+        _open.discard(self)
+        if self.owner:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        if not _try_close(shm):
+            with _deferred_lock:
+                _deferred.append(shm)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        name = self._shm.name if self._shm is not None else None
+        return f"SharedArray({name!r}, shape={self.shape}, dtype={self.dtype.str!r})"
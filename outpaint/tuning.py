@@ -0,0 +1,224 @@
+"""Worker threading policy and batch auto-tuning.
+
+A batch runs ``workers`` pool workers, and OpenCV runs its own thread
+pool inside each of them; left at OpenCV's default every worker starts
+one thread per core, so a full pool oversubscribes the machine. A
+ThreadPolicy sets the OpenCV threads per worker, by default CPUs divided
+by workers, and can pin each worker to its own block of CPUs. Workers are processes, or threads: cv2.inpaint,
+imdecode and imencode release the GIL, so threads avoid the process pool's
+start-up and transfer costs.
+
+tune() times a short calibration run for each executor and workers x
+threads split that fits the CPUs and returns the fastest, which the
+``tune`` command stores in config.json:
+
+    python -m outpaint tune --seconds 3
+"""
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import cv2
+
+from . import engine
+
+EXECUTORS = ("process", "thread")
+AFFINITY_MODES = ("none", "pin")
+
+# Calibration image size and minimum timed seconds per candidate
+CALIBRATION_MP = 1
+CALIBRATION_SECONDS = 2.0
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return tuple(sorted(os.sched_getaffinity(0)))
+    return tuple(range(os.cpu_count() or 1))
+
+
+def parse_cpus(text):
+    """CPU ids from a list such as '0-3,6'"""
+    cpus = set()
+    for item in text.split(','):
+        item = item.strip()
+        if '-' in item:
+            first, last = (int(v) for v in item.split('-', 1))
+            cpus.update(range(first, last + 1))
+        elif item:
+            cpus.add(int(item))
+    if not cpus:
+        raise ValueError(f"No CPUs in {text!r}")
+    return tuple(sorted(cpus))
+
+
+class ThreadPolicy:
+    """How each pool worker uses the CPUs
+
+    ``threads`` is passed to cv2.setNumThreads in every worker; None
+    shares ``cpus`` evenly between the workers (see for_workers()) and 0
+    leaves OpenCV's default of one thread per core. With ``affinity``
+    'pin' worker i is bound to the i-th block of ``threads`` CPUs out of
+    ``cpus`` (default: all CPUs the process may use), wrapping around
+    when there are more workers.
+    """
+
+    def __init__(self, threads=None, affinity="none", cpus=None):
+        if affinity not in AFFINITY_MODES:
+            raise ValueError(f"Unknown affinity mode: {affinity!r}")
+        self.threads = threads
+        self.affinity = affinity
+        self.cpus = tuple(cpus) if cpus else available_cpus()
+
+    def for_workers(self, workers):
+        """This policy with automatic threads resolved for a pool of ``workers``"""
+        if self.threads is not None:
+            return self
+        return ThreadPolicy(max(1, len(self.cpus) // max(1, workers)), self.affinity, self.cpus)
+
+    def cpu_set(self, index):
+        """CPUs worker ``index`` is pinned to"""
+        size = min(max(1, self.threads or 1), len(self.cpus))
+        start = (index * size) % len(self.cpus)
+        return {self.cpus[(start + i) % len(self.cpus)] for i in range(size)}
+
+    def apply(self, index=0):
+        """Apply the policy to the calling process or thread"""
+        if self.threads:
+            cv2.setNumThreads(self.threads)
+        # On Linux pid 0 is the calling thread, so thread workers pin separately
+        if self.affinity == "pin" and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.cpu_set(index))
+
+    def __repr__(self):
+        return f"ThreadPolicy(threads={self.threads}, affinity={self.affinity!r})"
+
+
+def _init_worker(policy, counter):
+    """Pool initializer: apply the policy with the next worker index"""
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    policy.apply(index)
+
+
+def make_pool(executor, workers, policy=None):
+    """Process or thread pool whose workers apply ``policy`` on start"""
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor!r}")
+    if policy is not None:
+        policy = policy.for_workers(workers)
+    if executor == "thread":
+        if policy is None:
+            return ThreadPoolExecutor(max_workers=workers)
+        return ThreadPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                  initargs=(policy, multiprocessing.Value('i', 0)))
+
+    # Spawned workers do not inherit the parent's threads and locks
+    ctx = multiprocessing.get_context('spawn')
+    if policy is None:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                               initargs=(policy, ctx.Value('i', 0)))
+
+
+def pool_params(params, policy):
+    """Engine parameters with the tiled executor held to the policy's threads"""
+    params = dict(params)
+    if policy is not None and policy.threads and params.get('tile_size'):
+        params.setdefault('workers', policy.threads)
+    return params
+
+
+def _powers_of_two(limit):
+    values, value = [], 1
+    while value < limit:
+        values.append(value)
+        value *= 2
+    return values + [limit]
+
+
+def candidates(cpu_count, executors=EXECUTORS):
+    """(executor, workers, threads) splits with workers x threads <= cpu_count"""
+    splits = [(workers, threads)
+              for workers in _powers_of_two(cpu_count)
+              for threads in _powers_of_two(cpu_count)
+              if workers * threads <= cpu_count]
+    return [(executor, workers, threads) for executor in executors for workers, threads in splits]
+
+
+def _calibration_task(image, params):
+    engine.outpaint(image, builder=engine.thread_builder(), **params)
+
+
+def calibrate(executor, workers, threads, image, params, seconds=CALIBRATION_SECONDS,
+              affinity="none", cpus=None):
+    """Images per second of one pool configuration
+
+    Every worker first processes one image untimed (start-up, imports and
+    buffer allocation); then 2 x workers images are kept in flight until
+    ``seconds`` have passed and each worker has finished at least two.
+    """
+    policy = ThreadPolicy(threads, affinity, cpus)
+    saved = cv2.getNumThreads()
+    try:
+        with make_pool(executor, workers, policy) as pool:
+            task_params = pool_params(params, policy)
+            wait([pool.submit(_calibration_task, image, task_params) for _ in range(workers)])
+
+            done = 0
+            in_flight = deque()
+            start = time.perf_counter()
+            while True:
+                while len(in_flight) < 2 * workers:
+                    in_flight.append(pool.submit(_calibration_task, image, task_params))
+                in_flight.popleft().result()
+                done += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= seconds and done >= 2 * workers:
+                    break
+            for future in in_flight:
+                future.cancel()
+    finally:
+        # Thread workers change OpenCV's threads for the whole process
+        cv2.setNumThreads(saved)
+    return done / elapsed
+
+
+def tune(params, megapixels=CALIBRATION_MP, seconds=CALIBRATION_SECONDS, executors=EXECUTORS,
+         affinity="none", cpus=None, progress=None):
+    """Calibrate every candidate and return the fastest as a settings dict
+
+    ``progress(executor, workers, threads, images_per_second)`` is called
+    after each candidate. The result also records the CPU count and all
+    measurements.
+    """
+    from .bench import synthetic_image
+
+    cpus = tuple(cpus) if cpus else available_cpus()
+    image = synthetic_image(megapixels)
+    results = []
+    for executor, workers, threads in candidates(len(cpus), executors):
+        rate = calibrate(executor, workers, threads, image, params, seconds, affinity, cpus)
+        results.append({'executor': executor, 'workers': workers, 'threads': threads,
+                        'images_per_second': round(rate, 3)})
+        if progress:
+            progress(executor, workers, threads, rate)
+
+    best = max(results, key=lambda result: result['images_per_second'])
+    return dict(best, cpus=len(cpus), megapixels=megapixels, affinity=affinity,
+                tuned_at=time.strftime("%Y-%m-%dT%H:%M:%S"), results=results)
+
+
+def apply_tuning(settings, tuning):
+    """Store a tune() result as the batch defaults in a settings dict"""
+    settings.update({
+        'batch_executor': tuning['executor'],
+        'batch_workers': tuning['workers'],
+        'batch_threads': tuning['threads'],
+        'cpu_affinity': tuning['affinity'],
+        'batch_tuning': tuning
+    })
+    return settings
@@ -0,0 +1,41 @@
+import numpy as np
+
+from outpaint.cache import ResultCache, cache_key, image_digest
+from outpaint.metrics import StageTimer
+
+PARAMS = {'expansion': 50, 'direction': "all", 'method': "telea", 'contrast': False}
+
+
+def _image(value=0):
+    image = np.zeros((8, 10, 3), dtype=np.uint8)
+    image[0, 0] = value
+    return image
+
+
+def test_key_is_stable():
+    assert cache_key(_image(), PARAMS) == cache_key(_image().copy(), dict(PARAMS))
+    assert cache_key(_image(), PARAMS) == cache_key(_image(), dict(reversed(list(PARAMS.items()))))
+    assert cache_key(_image(), PARAMS) == cache_key(None, PARAMS, digest=image_digest(_image()))
+
+
+def test_key_ignores_execution_parameters():
+    key = cache_key(_image(), PARAMS)
+    extra = {'workers': 4, 'builder': object(), 'temp_dir': "/tmp", 'timer': StageTimer()}
+    assert cache_key(_image(), dict(PARAMS, **extra)) == key
+
+
+def test_key_changes_with_pixels_and_parameters():
+    key = cache_key(_image(), PARAMS)
+    assert cache_key(_image(1), PARAMS) != key
+    assert cache_key(_image().reshape(10, 8, 3), PARAMS) != key
+    assert cache_key(_image(), dict(PARAMS, expansion=51)) != key
+    assert cache_key(_image(), dict(PARAMS, aspect=16 / 9)) != key
+
+
+def test_result_cache_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache_key(_image(), PARAMS)
+    assert cache.get(key) is None
+    cache.put(key, _image(7))
+    np.testing.assert_array_equal(cache.get(key), _image(7))
+    np.testing.assert_array_equal(ResultCache(str(tmp_path)).get(key), _image(7))
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from outpaint import engine
+from outpaint.backends import backend_names
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("direction", engine.DIRECTIONS)
+def test_output_shape_per_direction(image, direction):
+    top, bottom, left, right = engine.expansion_margins(12, direction)
+    result = engine.outpaint(image, 12, direction)
+    assert result.shape == (40 + top + bottom, 60 + left + right, 3)
+    assert result.dtype == np.uint8
+
+
+@pytest.mark.parametrize("fit, shape", [
+    ({'target_size': (100, 80)}, (80, 100, 3)),
+    ({'aspect': 1.0}, (60, 60, 3)),
+    ({'aspect': 16 / 9}, (40, 71, 3)),
+    ({'aspect': 9 / 16}, (107, 60, 3)),
+    ({'margins': (1, 2, 3, 4)}, (43, 67, 3)),
+])
+def test_output_shape_per_fit(image, fit, shape):
+    assert engine.output_shape(image.shape, **fit) == shape
+    assert engine.outpaint(image, **fit).shape == shape
+
+
+def test_fit_grows_only_the_allowed_sides(image):
+    assert engine.fit_margins(image.shape, 100, 40, "left") == (0, 0, 40, 0)
+    assert engine.fit_margins(image.shape, 100, 40, "horizontal") == (0, 0, 20, 20)
+    assert engine.fit_margins(image.shape, 65, 40, "horizontal") == (0, 0, 2, 3)
+    with pytest.raises(ValueError):
+        engine.fit_margins(image.shape, 100, 40, "vertical")
+    with pytest.raises(ValueError):
+        engine.fit_margins(image.shape, 50, 40)
+
+
+@pytest.mark.parametrize("method", backend_names())
+def test_original_pixels_preserved(image, method):
+    result = engine.outpaint(image, 10, "all", method, backend_options={'time_budget': 1})
+    np.testing.assert_array_equal(result[10:50, 10:70], image)
+
+
+@pytest.mark.parametrize("options", [
+    {'mode': "band"},
+    {'tile_size': 32},
+    {'memory_budget': 1},
+])
+def test_original_pixels_preserved_per_path(image, options):
+    result = engine.outpaint(image, 16, "all", **options)
+    np.testing.assert_array_equal(result[16:56, 16:76], image)
+
+
+def test_parse_margins():
+    assert engine.parse_margins("1,2,3,4") == (1, 2, 3, 4)
+    assert engine.parse_margins(" 0, 0,5 ,0") == (0, 0, 5, 0)
+    for text in ("1,2,3", "1,2,3,4,5", "-1,0,0,0", "a,b,c,d", ""):
+        with pytest.raises(ValueError):
+            engine.parse_margins(text)
+
+
+def test_aspect_margins():
+    assert engine.aspect_margins((40, 60), 1.5) == (0, 0, 0, 0)
+    assert engine.aspect_margins((40, 60), 2.0) == (0, 0, 10, 10)
+    assert engine.aspect_margins((40, 60), 1.0) == (10, 10, 0, 0)
+    assert engine.aspect_margins((40, 60), 2.0, "right") == (0, 0, 0, 20)
+    # An odd number of extra pixels puts the larger half after the image
+    assert engine.aspect_margins((40, 61), 2.0) == (0, 0, 9, 10)
+    with pytest.raises(ValueError):
+        engine.aspect_margins((40, 60), 2.0, "vertical")
+    for aspect in (0, -1.0):
+        with pytest.raises(ValueError):
+            engine.aspect_margins((40, 60), aspect)
+
+
+def test_parse_fit():
+    assert engine.parse_fit("") == {}
+    assert engine.parse_fit("16:9") == {'aspect': 16 / 9}
+    assert engine.parse_fit("4/3") == {'aspect': 4 / 3}
+    assert engine.parse_fit("1920X1080") == {'target_size': (1920, 1080)}
+    assert engine.parse_fit("1,2,3,4") == {'margins': (1, 2, 3, 4)}
+    for text in ("wide", "0:9", "0x10", "1,2"):
+        with pytest.raises(ValueError):
+            engine.parse_fit(text)
+
+
+def test_margins_take_precedence():
+    margins = engine.outpaint_margins((40, 60), 50, "all", margins=(1, 2, 3, 4), aspect=2.0,
+                                      target_size=(100, 100))
+    assert margins == (1, 2, 3, 4)
+    assert engine.outpaint_margins((40, 60), 50, "all", aspect=2.0,
+                                   target_size=(100, 100)) == (30, 30, 20, 20)
+    with pytest.raises(ValueError):
+        engine.outpaint_margins((40, 60))
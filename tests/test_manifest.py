@@ -0,0 +1,82 @@
+import argparse
+import io
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from outpaint.cli import iter_jobs
+from outpaint.manifest import Manifest
+
+
+def _write(path, value=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(str(path), np.full((8, 8, 3), value, dtype=np.uint8))
+    return str(path)
+
+
+def _args(source, output, resume=True):
+    return argparse.Namespace(input=source, output=output, recursive=True, format='png',
+                              resume=resume)
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    return [_write(os.path.join(tmp_path, "in", name)) for name in ("a.png", "b.png", "c.png")]
+
+
+def test_resume_skips_recorded_inputs(tmp_path, inputs):
+    out = os.path.join(tmp_path, "out")
+    path = os.path.join(tmp_path, "manifest.jsonl")
+    jobs = list(iter_jobs(_args(os.path.join(tmp_path, "in"), out), Manifest(path).load()))
+    assert [source for source, _ in jobs] == inputs
+
+    with Manifest(path) as manifest:
+        for source, target in jobs[:2]:
+            _write(target)
+            manifest.record(source, target)
+
+    resumed = list(iter_jobs(_args(os.path.join(tmp_path, "in"), out), Manifest(path).load()))
+    assert resumed == jobs[2:]
+
+
+def test_resume_redoes_changed_or_missing_work(tmp_path, inputs):
+    path = os.path.join(tmp_path, "manifest.jsonl")
+    outputs = [_write(os.path.join(tmp_path, "out", f"{i}.png")) for i in range(3)]
+    with Manifest(path) as manifest:
+        for source, target in zip(inputs, outputs):
+            manifest.record(source, target)
+
+    os.remove(outputs[0])
+    _write(inputs[1], 255)
+    st = os.stat(inputs[1])
+    os.utime(inputs[1], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    manifest = Manifest(path).load()
+    assert [manifest.is_done(source) for source in inputs] == [False, False, True]
+
+
+def test_torn_last_line_is_ignored(tmp_path, inputs):
+    path = os.path.join(tmp_path, "manifest.jsonl")
+    target = _write(os.path.join(tmp_path, "out", "a.png"))
+    with Manifest(path) as manifest:
+        manifest.record(inputs[0], target)
+    with open(path, 'a') as f:
+        f.write('{"input": "trunc')
+    manifest = Manifest(path).load()
+    assert manifest.is_done(inputs[0])
+    assert len(manifest.done) == 1
+
+
+def test_listed_inputs_keep_their_layout(tmp_path, monkeypatch):
+    sources = [_write(os.path.join(tmp_path, "in", sub, name))
+               for sub, name in (("a", "img.png"), ("b", "img.png"), ("a", "img.jpg"))]
+    monkeypatch.setattr('sys.stdin', io.StringIO("\n".join(sources + sources[:1]) + "\n"))
+    out = os.path.join(tmp_path, "out")
+    jobs = list(iter_jobs(_args('-', out, resume=False), Manifest(os.devnull)))
+    assert [source for source, _ in jobs] == sources
+    assert [os.path.relpath(target, out) for _, target in jobs] == [
+        os.path.join("a", "img_batch_outpainted.png"),
+        os.path.join("b", "img_batch_outpainted.png"),
+        os.path.join("a", "img_jpg_batch_outpainted.png"),
+    ]
@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+
+from outpaint.server import OutpaintServer, RequestError
+
+
+def test_full_queue_answers_429():
+    async def run():
+        server = OutpaintServer({'expansion': 10}, workers=1, queue_size=2)
+        # Admission only; no pool or dispatcher runs, so the queue stays full
+        server._ready = asyncio.Event()
+        first = server.submit(b"one", {}, '.png', [])
+        assert server.submit(b"one", {}, '.png', []) is first
+        server.submit(b"two", {}, '.png', [])
+        with pytest.raises(RequestError) as error:
+            server.submit(b"three", {}, '.png', [])
+        assert error.value.status == 429
+        assert server.stats()['queued'] == 2
+
+    asyncio.run(run())